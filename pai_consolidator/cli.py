@@ -2,12 +2,351 @@
 Interfaz de línea de comandos para el consolidador de datos PAI.
 """
 import os
+import stat
 import argparse
 import sys
-import json
+import heapq
+import importlib.util
 from datetime import datetime
-import pandas as pd
-from .core.processor import PaiProcessor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# pandas, numpy, json y el procesador se importan dentro de las funciones que los usan:
+# así "--help" y los errores de argumentos no pagan el costo de importar pandas.
+
+# Límites de una hoja de Excel (pandas valida lo mismo antes de escribir)
+LIMITE_FILAS_EXCEL = 1048576
+LIMITE_COLUMNAS_EXCEL = 16384
+
+# Filas que se convierten a valores de Python de una vez al escribir una hoja de datos
+FILAS_POR_BLOQUE = 10000
+
+# Las filas se escriben en orden, así que xlsxwriter puede volcarlas a disco sin retenerlas
+OPCIONES_LIBRO = {
+    "constant_memory": True,
+    "default_date_format": "yyyy-mm-dd hh:mm:ss"
+}
+
+def _mayores_conteos(conteos, n):
+    """
+    Obtiene los n pares (valor, conteo) con mayor conteo sin ordenar todo el diccionario.
+    
+    Args:
+        conteos: Diccionario {valor: conteo}.
+        n: Número de pares a devolver.
+        
+    Returns:
+        Lista de tuplas (valor, conteo) de mayor a menor conteo.
+    """
+    return heapq.nlargest(n, conteos.items(), key=lambda x: x[1])
+
+def _valores_columna(serie):
+    """
+    Convierte una columna en lista de valores de Python, con NaN/NaT como None
+    (celda vacía) e infinitos como "inf"/"-inf" (igual que pandas.to_excel), para
+    que xlsxwriter pueda escribirlos directamente.
+    
+    Args:
+        serie: Serie de pandas a convertir.
+        
+    Returns:
+        Lista con los valores de la columna.
+    """
+    import numpy as np
+    
+    infinitos = None
+    if serie.dtype.kind == "f":
+        infinitos = np.isinf(serie.to_numpy())
+        if not infinitos.any():
+            infinitos = None
+    
+    if infinitos is None and not serie.hasnans:
+        return serie.tolist()
+    
+    valores = serie.astype(object).where(serie.notna(), None)
+    if infinitos is not None:
+        valores[infinitos] = np.where(serie.to_numpy()[infinitos] > 0, "inf", "-inf")
+    return valores.tolist()
+
+def _escribir_hoja_datos(libro, df, nombre_hoja):
+    """
+    Escribe un DataFrame fila por fila en una hoja nueva de un libro xlsxwriter,
+    sin pasar por la conversión celda a celda de pandas.to_excel.
+    
+    Las filas se convierten a valores de Python por bloques, para no tener una copia
+    completa del DataFrame en objetos de Python mientras se escribe.
+    
+    Args:
+        libro: Libro de xlsxwriter abierto (admite constant_memory).
+        df: DataFrame a escribir (sin índice).
+        nombre_hoja: Nombre de la hoja a crear.
+    """
+    if df.columns.nlevels > 1:
+        raise NotImplementedError(
+            "No se puede escribir en Excel un DataFrame con columnas MultiIndex sin índice"
+        )
+    
+    if len(df) + 1 > LIMITE_FILAS_EXCEL or len(df.columns) > LIMITE_COLUMNAS_EXCEL:
+        raise ValueError(
+            f"La hoja es demasiado grande: {len(df) + 1} filas y {len(df.columns)} columnas "
+            f"(máximo {LIMITE_FILAS_EXCEL} y {LIMITE_COLUMNAS_EXCEL})"
+        )
+    
+    hoja = libro.add_worksheet(nombre_hoja)
+    
+    # Encabezado con el mismo estilo que usa pandas
+    formato_encabezado = libro.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    hoja.write_row(0, 0, list(df.columns), formato_encabezado)
+    
+    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+        bloque = df.iloc[inicio:inicio + FILAS_POR_BLOQUE]
+        columnas = [_valores_columna(bloque.iloc[:, i]) for i in range(len(bloque.columns))]
+        for fila, valores in enumerate(zip(*columnas), start=inicio + 1):
+            hoja.write_row(fila, 0, valores)
+
+def _tabla_arrow(df):
+    """
+    Construye una tabla de Arrow columna a columna directamente desde los arreglos
+    del DataFrame, sin pasar por pandas.to_parquet.
+    
+    Las columnas de texto que mezclan tipos (p. ej. fechas y texto en una misma
+    columna de Excel) se guardan como texto en lugar de hacer fallar la copia.
+    
+    Args:
+        df: DataFrame a convertir (sin índice).
+        
+    Returns:
+        pyarrow.Table con las columnas del DataFrame.
+    """
+    import pyarrow as pa
+    
+    arreglos = []
+    for i in range(len(df.columns)):
+        serie = df.iloc[:, i]
+        try:
+            arreglos.append(pa.array(serie, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            texto = serie.astype(str).where(serie.notna(), None)
+            arreglos.append(pa.array(texto, type=pa.string(), from_pandas=True))
+    
+    return pa.Table.from_arrays(arreglos, names=[str(c) for c in df.columns])
+
+def _escribir_hoja_filas(libro, filas, nombre_hoja):
+    """
+    Escribe una lista de pares (etiqueta, valor) en una hoja nueva, sin encabezado.
+    
+    Args:
+        libro: Libro de xlsxwriter abierto.
+        filas: Lista de tuplas (etiqueta, valor); (None, None) deja la fila vacía.
+        nombre_hoja: Nombre de la hoja a crear.
+    """
+    hoja = libro.add_worksheet(nombre_hoja)
+    for fila, valores in enumerate(filas):
+        hoja.write_row(fila, 0, valores)
+
+def _distribucion_etaria(distribucion, total_registros):
+    """
+    Calcula una sola vez los textos "conteo (porcentaje%)" por grupo etario,
+    compartidos por la hoja Resumen y el resumen en pantalla.
+    
+    Args:
+        distribucion: Diccionario {grupo etario: conteo}.
+        total_registros: Número de registros sobre el que se calculan los porcentajes.
+        
+    Returns:
+        Lista de tuplas (grupo, texto) ordenada por grupo.
+    """
+    factor = 100 / max(total_registros, 1)
+    return [
+        (grupo, f"{count} ({count*factor:.1f}%)")
+        for grupo, count in sorted(distribucion.items())
+    ]
+
+def _lineas_resumen(tipo, total_registros, estadisticas, etaria):
+    """
+    Arma las líneas del resumen en pantalla de un tipo de consolidado.
+    
+    Args:
+        tipo: Tipo de consolidado ("residencia" o "vacunacion").
+        total_registros: Número de registros del consolidado.
+        estadisticas: Estadísticas generadas para el consolidado.
+        etaria: Distribución por grupo etario ya formateada (ver _distribucion_etaria).
+        
+    Returns:
+        Lista de líneas de texto (sin salto de línea final).
+    """
+    lineas = [
+        f"\nResumen de datos consolidados por {tipo}:",
+        f"- Total de registros: {total_registros}"
+    ]
+    
+    if tipo == "vacunacion":
+        n_municipios = estadisticas.get("total_municipios", 0)
+        lineas.append(f"- Municipios de vacunación: {n_municipios}")
+        
+        # Mostrar top 5 municipios
+        top_municipios = _mayores_conteos(estadisticas.get("municipios_vacunacion", {}), 5)
+        if top_municipios:
+            lineas.append("  Top 5 municipios por cantidad de registros:")
+            lineas.extend(f"    * {muni}: {count} registros" for muni, count in top_municipios)
+    else:
+        n_deptos = estadisticas.get("total_departamentos", 0)
+        n_municipios = estadisticas.get("total_municipios_residencia", 0)
+        
+        lineas.append(f"- Departamentos de residencia: {n_deptos}")
+        lineas.append(f"- Municipios de residencia: {n_municipios}")
+        
+        # Mostrar top 5 departamentos
+        top_deptos = _mayores_conteos(estadisticas.get("departamentos_residencia", {}), 5)
+        if top_deptos:
+            lineas.append("  Top 5 departamentos por cantidad de registros:")
+            lineas.extend(f"    * {depto}: {count} registros" for depto, count in top_deptos)
+    
+    if "total_vacunados" in estadisticas:
+        lineas.append(f"- Total de vacunaciones: {estadisticas['total_vacunados']}")
+        
+        # Desglose por tipo de dosis
+        if "tipos_dosis" in estadisticas:
+            lineas.extend(
+                f"  - {nombre}: {info['total']} ({info['porcentaje']}%)"
+                for nombre, info in estadisticas["tipos_dosis"].items()
+            )
+    
+    # Mostrar distribución por grupo etario
+    if "distribucion_grupo_etario" in estadisticas:
+        lineas.append("- Distribución por grupo etario:")
+        lineas.extend(f"  - {grupo}: {texto}" for grupo, texto in etaria)
+    
+    return lineas
+
+def _guardar_consolidado(tipo, df, estadisticas, etaria, args, meta_procesador, fecha_actual, fecha_generacion):
+    """
+    Escribe el archivo Excel (y opcionalmente el JSON de estadísticas) de un tipo de consolidado.
+    Está a nivel de módulo para poder ejecutarse en un proceso independiente.
+    
+    Args:
+        tipo: Tipo de consolidado ("residencia" o "vacunacion").
+        df: DataFrame con los datos a guardar.
+        estadisticas: Estadísticas generadas para el DataFrame.
+        etaria: Distribución por grupo etario ya formateada (ver _distribucion_etaria).
+        args: Argumentos de la línea de comandos.
+        meta_procesador: Contadores del procesador (archivos, advertencias y registros)
+            y ruta absoluta del directorio procesado.
+        fecha_actual: Fecha usada en los nombres de archivo.
+        fecha_generacion: Fecha y hora mostradas en la hoja de resumen.
+        
+    Returns:
+        Lista de mensajes para mostrar al usuario.
+    """
+    import xlsxwriter
+    
+    mensajes = []
+    
+    # Nombre de archivo (sufijo común a todos los archivos de este tipo)
+    sufijo = f"{args.vacuna.replace(' ', '_')}_{tipo}_{fecha_actual}"
+    ruta_salida = os.path.join(args.salida, f"Consolidado_{sufijo}.xlsx")
+    
+    # Generar archivo Excel más completo
+    try:
+        # Escribir directamente con xlsxwriter, fila por fila y en modo de memoria constante
+        with xlsxwriter.Workbook(ruta_salida, OPCIONES_LIBRO) as libro:
+            # Hoja principal de datos
+            _escribir_hoja_datos(libro, df, 'Datos')
+            
+            # Hojas de resumen y metadatos (se omiten con --quiet)
+            if not args.quiet:
+                # Hoja de resumen
+                resumen = []
+                resumen.append(("Fecha de generación", fecha_generacion))
+                resumen.append(("Vacuna analizada", args.vacuna))
+                resumen.append(("Tipo de consolidado", tipo))
+                resumen.append(("Total de registros", len(df)))
+                
+                if tipo == "vacunacion":
+                    n_municipios = estadisticas.get("total_municipios", 0)
+                    resumen.append(("Municipios de vacunación", n_municipios))
+                    # Incluir conteo por municipio
+                    resumen.append((None, None))
+                    resumen.append(("Distribución por municipio de vacunación", ""))
+                    for municipio, count in _mayores_conteos(estadisticas.get("municipios_vacunacion", {}), 20):
+                        resumen.append((municipio, count))
+                else:
+                    n_deptos = estadisticas.get("total_departamentos", 0)
+                    n_municipios = estadisticas.get("total_municipios_residencia", 0)
+                    resumen.append(("Departamentos de residencia", n_deptos))
+                    resumen.append(("Municipios de residencia", n_municipios))
+                    # Incluir conteo por departamento
+                    resumen.append((None, None))
+                    resumen.append(("Distribución por departamento de residencia", ""))
+                    for depto, count in _mayores_conteos(estadisticas.get("departamentos_residencia", {}), 20):
+                        resumen.append((depto, count))
+                
+                if "total_vacunados" in estadisticas:
+                    total_vacunados = estadisticas["total_vacunados"]
+                    resumen.append((None, None))
+                    resumen.append(("Total de vacunaciones", total_vacunados))
+                    
+                    # Desglose por tipo de dosis
+                    if "tipos_dosis" in estadisticas:
+                        resumen.append((None, None))
+                        resumen.append(("Distribución por tipo de dosis", ""))
+                        for nombre, info in estadisticas["tipos_dosis"].items():
+                            resumen.append((nombre, f"{info['total']} ({info['porcentaje']}%)"))
+                
+                # Distribución por grupo etario
+                if "distribucion_grupo_etario" in estadisticas:
+                    resumen.append((None, None))
+                    resumen.append(("Distribución por grupo etario", ""))
+                    resumen.extend(etaria)
+                
+                # Escribir resumen
+                _escribir_hoja_filas(libro, resumen, 'Resumen')
+                
+                # Hoja de metadatos
+                metadatos = []
+                metadatos.append(("Archivos procesados", meta_procesador["archivos_procesados"]))
+                metadatos.append(("Archivos con advertencias", meta_procesador["advertencias"]))
+                metadatos.append(("Total de registros procesados", meta_procesador["registros_totales"]))
+                metadatos.append(("Patrón utilizado", args.patron))
+                
+                if args.modo in ["todo", "consolidar"]:
+                    metadatos.append(("Directorio procesado", meta_procesador["directorio_procesado"]))
+                
+                # Detalles técnicos de columnas
+                metadatos.append((None, None))
+                metadatos.append(("Columnas en el archivo", len(df.columns)))
+                
+                # Listado de columnas con datos no vacíos
+                metadatos.append((None, None))
+                metadatos.append(("Columnas con datos (no vacías)", "Porcentaje de celdas con datos"))
+                # Una sola reducción sobre todo el DataFrame en lugar de una por columna
+                no_vacios = df.notna().sum()
+                porcentajes = no_vacios / len(df) * 100 if len(df) > 0 else no_vacios * 0
+                for col, porcentaje in porcentajes.items():
+                    if porcentaje > 0:
+                        metadatos.append((col, f"{porcentaje:.1f}%"))
+                
+                # Escribir metadatos
+                _escribir_hoja_filas(libro, metadatos, 'Metadatos')
+        
+        mensajes.append(f"Archivo consolidado por {tipo} guardado en: {ruta_salida}")
+        
+        # Generar archivo de estadísticas en JSON si se solicita
+        if args.estadisticas:
+            import json
+            
+            ruta_json = os.path.join(args.salida, f"Estadisticas_{sufijo}.json")
+            with open(ruta_json, 'w', encoding='utf-8') as f:
+                json.dump(estadisticas, f, ensure_ascii=False, indent=4)
+            mensajes.append(f"Archivo de estadísticas guardado en: {ruta_json}")
+        
+    except Exception as e:
+        mensajes.append(f"Error al guardar archivo Excel: {str(e)}")
+        # Intentar guardar en CSV como alternativa
+        ruta_csv = os.path.join(args.salida, f"Consolidado_{sufijo}.csv")
+        df.to_csv(ruta_csv, index=False)
+        mensajes.append(f"Se ha guardado una versión CSV alternativa en: {ruta_csv}")
+    
+    return mensajes
 
 def main():
     """
@@ -50,11 +389,13 @@ def main():
     
     parser.add_argument(
         "--año", "-a",
+        type=int,
         help="Filtrar archivos por año específico (ej: 2025)"
     )
     
     parser.add_argument(
         "--mes", "-m",
+        type=int,
         help="Filtrar archivos por mes específico (ej: 04 para abril)"
     )
     
@@ -102,12 +443,47 @@ def main():
         help="Usar procesamiento paralelo para mejorar rendimiento con múltiples archivos"
     )
     
+    parser.add_argument(
+        "--hilos",
+        action="store_true",
+        help="Con --paralelo, usar hilos en lugar de procesos (arranque más liviano; útil con calamine)"
+    )
+    
+    parser.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Omitir el progreso por archivo, el resumen en pantalla y las hojas Resumen/Metadatos (solo se escriben los datos)"
+    )
+    
+    parser.add_argument(
+        "--cache", "-C",
+        default=None,
+        help="Directorio de caché: los archivos sin cambios desde la última ejecución no se vuelven a leer"
+    )
+    
+    parser.add_argument(
+        "--motor",
+        choices=["calamine", "openpyxl", "xlrd"],
+        default=None,
+        help="Motor para leer los archivos Excel (por defecto: calamine si está instalado, si no openpyxl/xlrd)"
+    )
+    
     args = parser.parse_args()
     
     # Verificar que el directorio de entrada existe (si es requerido)
-    if args.modo in ["todo", "consolidar"] and not os.path.isdir(args.directorio):
-        print(f"Error: El directorio {args.directorio} no existe")
-        sys.exit(1)
+    # (un solo stat; la ruta absoluta se calcula una vez y se reutiliza en los metadatos)
+    directorio_abs = None
+    if args.modo in ["todo", "consolidar"]:
+        try:
+            es_directorio = stat.S_ISDIR(os.stat(args.directorio).st_mode)
+        except OSError:
+            es_directorio = False
+        
+        if not es_directorio:
+            print(f"Error: El directorio {args.directorio} no existe")
+            sys.exit(1)
+        
+        directorio_abs = os.path.abspath(args.directorio)
     
     # Verificar archivo consolidado (si es requerido)
     if args.modo == "filtrar" and not args.archivo_consolidado:
@@ -118,13 +494,33 @@ def main():
         print(f"Error: El archivo consolidado {args.archivo_consolidado} no existe")
         sys.exit(1)
     
+    # Importaciones pesadas solo después de validar los argumentos
+    import numpy as np
+    import pandas as pd
+    import xlsxwriter
+    from .core.processor import PaiProcessor
+    from .core.utils import compilar_patrones_exclusion, obtener_motor_excel
+    
+    # Copy-on-Write: las selecciones y reordenamientos de columnas (consolidados por
+    # vacunación y por residencia) comparten los datos en lugar de copiarlos enteros.
+    # Se activa aquí y no al importar el paquete para no cambiar el modo de quien lo use
+    # como biblioteca
+    pd.set_option("mode.copy_on_write", True)
+    
     # Crear directorio de salida si no existe
     os.makedirs(args.salida, exist_ok=True)
     
+    # Fechas usadas en nombres de archivo y resúmenes (una sola vez por ejecución)
+    ahora = datetime.now()
+    fecha_actual = ahora.strftime("%Y%m%d")
+    fecha_generacion = ahora.strftime("%Y-%m-%d %H:%M")
+    
     print("\n= PAI Consolidator =")
     print(f"Modo: {args.modo}")
 
-    if args.paralelo:
+    if args.paralelo and args.hilos:
+        print("Procesamiento: Paralelo (multi-hilo)")
+    elif args.paralelo:
         print("Procesamiento: Paralelo (multi-core)")
     else:
         print("Procesamiento: Secuencial (single-core)")
@@ -150,14 +546,18 @@ def main():
     # Crear procesador
     processor = PaiProcessor(
         modo_detallado=args.detalles,
-        ignorar_errores=args.ignorar_errores
+        ignorar_errores=args.ignorar_errores,
+        directorio_cache=args.cache,
+        motor_excel=args.motor,
+        mostrar_progreso=not args.quiet,
+        usar_hilos=args.hilos
     )
     
     # Ejecutar según el modo
     if args.modo in ["todo", "consolidar"]:
         # Consolidar datos
         print("\nFase 1: Consolidando todos los datos...")
-        excluir_patrones = args.excluir.split(",") if args.excluir else None
+        excluir_patrones = compilar_patrones_exclusion(args.excluir.split(",")) if args.excluir else None
         
         df_consolidado = processor.consolidar_archivos(
             args.directorio,
@@ -171,11 +571,11 @@ def main():
             sys.exit(1)
         
         # Guardar consolidado general
-        fecha_actual = datetime.now().strftime("%Y%m%d")
         ruta_consolidado = os.path.join(args.salida, f"Consolidado_General_{fecha_actual}.xlsx")
         
         try:
-            df_consolidado.to_excel(ruta_consolidado, index=False)
+            with xlsxwriter.Workbook(ruta_consolidado, OPCIONES_LIBRO) as libro:
+                _escribir_hoja_datos(libro, df_consolidado, 'Sheet1')
             print(f"\nArchivo consolidado general guardado en: {ruta_consolidado}")
         except Exception as e:
             print(f"Error al guardar archivo consolidado general: {str(e)}")
@@ -183,16 +583,42 @@ def main():
             ruta_csv = os.path.join(args.salida, f"Consolidado_General_{fecha_actual}.csv")
             df_consolidado.to_csv(ruta_csv, index=False)
             print(f"Se ha guardado una versión CSV en: {ruta_csv}")
+        
+        # Copia en Parquet (tipada y mucho más rápida de recargar en modo 'filtrar')
+        if importlib.util.find_spec("pyarrow") is not None:
+            ruta_parquet = os.path.splitext(ruta_consolidado)[0] + ".parquet"
+            try:
+                import pyarrow.parquet as pq
+                pq.write_table(_tabla_arrow(df_consolidado), ruta_parquet, compression="zstd")
+                print(f"Copia Parquet guardada en: {ruta_parquet}")
+            except Exception as e:
+                print(f"No se pudo guardar la copia Parquet: {str(e)}")
     
     if args.modo == "filtrar":
         # Cargar datos consolidados previamente
         print(f"\nCargando datos consolidados desde: {args.archivo_consolidado}")
         try:
-            extension = os.path.splitext(args.archivo_consolidado)[1].lower()
-            if extension == ".csv":
+            base, extension = os.path.splitext(args.archivo_consolidado)
+            extension = extension.lower()
+            ruta_parquet = base + ".parquet"
+            
+            # Preferir la copia Parquet generada junto al consolidado, si existe y no es
+            # anterior al archivo indicado (si este se editó o regeneró después, la copia
+            # tendría datos desactualizados)
+            if extension != ".parquet" and os.path.isfile(ruta_parquet):
+                if os.path.getmtime(ruta_parquet) >= os.path.getmtime(args.archivo_consolidado):
+                    print(f"Usando copia Parquet: {ruta_parquet}")
+                    extension = ".parquet"
+                else:
+                    print(f"La copia Parquet {ruta_parquet} es anterior al archivo indicado; "
+                          f"se usa: {args.archivo_consolidado}")
+            
+            if extension == ".parquet":
+                df_consolidado = pd.read_parquet(ruta_parquet)
+            elif extension == ".csv":
                 df_consolidado = pd.read_csv(args.archivo_consolidado)
             else:
-                df_consolidado = pd.read_excel(args.archivo_consolidado)
+                df_consolidado = pd.read_excel(args.archivo_consolidado, engine=obtener_motor_excel(args.archivo_consolidado, args.motor))
             
             processor.datos_consolidados = df_consolidado
             print(f"Datos cargados: {len(df_consolidado)} registros")
@@ -213,178 +639,80 @@ def main():
             sys.exit(1)
         
         # Guardar resultados filtrados
-        fecha_actual = datetime.now().strftime("%Y%m%d")
+        meta_procesador = {
+            "archivos_procesados": processor.archivos_procesados,
+            "advertencias": len(processor.advertencias),
+            "registros_totales": processor.registros_totales,
+            "directorio_procesado": directorio_abs
+        }
         
+        # Preparar cada tipo de consolidado (filtros y estadísticas)
+        pendientes = []
+        # Residencia y vacunación comparten filas: las estadísticas comunes se calculan una vez
+        comunes = None
+        indice_comunes = None
+        etaria = []
         for tipo, df in resultado_filtrado.items():
             # Filtrar por año y mes si se especifican
             if args.año or args.mes:
                 print(f"\nAplicando filtros: Año={args.año or 'Todos'}, Mes={args.mes or 'Todos'}")
-                df_original = df.copy()
+                n_original = len(df)
+                
+                # Comparar sobre columnas numéricas con una única máscara vectorizada
+                # (los valores pueden llegar como texto "04" o como enteros desde CSV)
+                mascara = np.ones(len(df), dtype=bool)
                 
                 if args.año and "Año_Registro" in df.columns:
-                    df = df[df["Año_Registro"] == args.año]
+                    años = pd.to_numeric(df["Año_Registro"], errors="coerce", downcast="integer")
+                    mascara &= años.to_numpy() == args.año
                 
                 if args.mes and "Mes_Registro" in df.columns:
-                    df = df[df["Mes_Registro"] == args.mes]
+                    meses = pd.to_numeric(df["Mes_Registro"], errors="coerce", downcast="integer")
+                    mascara &= meses.to_numpy() == args.mes
+                
+                df = df[mascara]
                 
-                print(f"Filtrado: {len(df)} de {len(df_original)} registros")
+                print(f"Filtrado: {len(df)} de {n_original} registros")
                 
                 if df.empty:
                     print(f"Advertencia: No hay datos para el filtro año={args.año}, mes={args.mes}")
                     continue
             
-            # Nombre de archivo
-            nombre_archivo = f"Consolidado_{args.vacuna.replace(' ', '_')}_{tipo}_{fecha_actual}.xlsx"
-            ruta_salida = os.path.join(args.salida, nombre_archivo)
-            
-            # Generar archivo Excel más completo
-            try:
-                # Crear un escritor de Excel con formato mejorado
-                with pd.ExcelWriter(ruta_salida, engine='openpyxl') as writer:
-                    # Hoja principal de datos
-                    df.to_excel(writer, sheet_name='Datos', index=False)
-                    
-                    # Generar estadísticas
-                    estadisticas = processor.generar_estadisticas(df, tipo)
-                    
-                    # Hoja de resumen
-                    resumen = []
-                    resumen.append(["Fecha de generación", datetime.now().strftime("%Y-%m-%d %H:%M")])
-                    resumen.append(["Vacuna analizada", args.vacuna])
-                    resumen.append(["Tipo de consolidado", tipo])
-                    resumen.append(["Total de registros", len(df)])
-                    
-                    if tipo == "vacunacion":
-                        n_municipios = estadisticas.get("total_municipios", 0)
-                        resumen.append(["Municipios de vacunación", n_municipios])
-                        # Incluir conteo por municipio
-                        resumen.append([])
-                        resumen.append(["Distribución por municipio de vacunación", ""])
-                        for municipio, count in sorted(estadisticas.get("municipios_vacunacion", {}).items(), 
-                                                      key=lambda x: x[1], reverse=True)[:20]:
-                            resumen.append([municipio, count])
-                    else:
-                        n_deptos = estadisticas.get("total_departamentos", 0)
-                        n_municipios = estadisticas.get("total_municipios_residencia", 0)
-                        resumen.append(["Departamentos de residencia", n_deptos])
-                        resumen.append(["Municipios de residencia", n_municipios])
-                        # Incluir conteo por departamento
-                        resumen.append([])
-                        resumen.append(["Distribución por departamento de residencia", ""])
-                        for depto, count in sorted(estadisticas.get("departamentos_residencia", {}).items(), 
-                                                 key=lambda x: x[1], reverse=True)[:20]:
-                            resumen.append([depto, count])
-                    
-                    if "total_vacunados" in estadisticas:
-                        total_vacunados = estadisticas["total_vacunados"]
-                        resumen.append([])
-                        resumen.append(["Total de vacunaciones", total_vacunados])
-                        
-                        # Desglose por tipo de dosis
-                        if "tipos_dosis" in estadisticas:
-                            resumen.append([])
-                            resumen.append(["Distribución por tipo de dosis", ""])
-                            for nombre, info in estadisticas["tipos_dosis"].items():
-                                resumen.append([nombre, f"{info['total']} ({info['porcentaje']}%)"])
-                    
-                    # Distribución por grupo etario
-                    if "distribucion_grupo_etario" in estadisticas:
-                        resumen.append([])
-                        resumen.append(["Distribución por grupo etario", ""])
-                        for grupo, count in sorted(estadisticas["distribucion_grupo_etario"].items()):
-                            porcentaje = count/len(df)*100
-                            resumen.append([grupo, f"{count} ({porcentaje:.1f}%)"])
-                    
-                    # Escribir resumen
-                    pd.DataFrame(resumen).to_excel(writer, sheet_name='Resumen', index=False, header=False)
-                    
-                    # Hoja de metadatos
-                    metadatos = []
-                    metadatos.append(["Archivos procesados", processor.archivos_procesados])
-                    metadatos.append(["Archivos con advertencias", len(processor.advertencias)])
-                    metadatos.append(["Total de registros procesados", processor.registros_totales])
-                    metadatos.append(["Patrón utilizado", args.patron])
-                    
-                    if args.modo in ["todo", "consolidar"]:
-                        metadatos.append(["Directorio procesado", os.path.abspath(args.directorio)])
-                    
-                    # Detalles técnicos de columnas
-                    metadatos.append([])
-                    metadatos.append(["Columnas en el archivo", len(df.columns)])
-                    
-                    # Listado de columnas con datos no vacíos
-                    metadatos.append([])
-                    metadatos.append(["Columnas con datos (no vacías)", "Porcentaje de celdas con datos"])
-                    for col in df.columns:
-                        no_vacios = df[col].notna().sum()
-                        porcentaje = no_vacios / len(df) * 100 if len(df) > 0 else 0
-                        if porcentaje > 0:
-                            metadatos.append([col, f"{porcentaje:.1f}%"])
-                    
-                    # Escribir metadatos
-                    pd.DataFrame(metadatos).to_excel(writer, sheet_name='Metadatos', index=False, header=False)
-                
-                print(f"Archivo consolidado por {tipo} guardado en: {ruta_salida}")
-                
-                # Generar archivo de estadísticas en JSON si se solicita
-                if args.estadisticas:
-                    ruta_json = os.path.join(args.salida, f"Estadisticas_{args.vacuna.replace(' ', '_')}_{tipo}_{fecha_actual}.json")
-                    with open(ruta_json, 'w', encoding='utf-8') as f:
-                        json.dump(estadisticas, f, ensure_ascii=False, indent=4)
-                    print(f"Archivo de estadísticas guardado en: {ruta_json}")
-                
-            except Exception as e:
-                print(f"Error al guardar archivo Excel: {str(e)}")
-                # Intentar guardar en CSV como alternativa
-                ruta_csv = os.path.join(args.salida, f"Consolidado_{args.vacuna.replace(' ', '_')}_{tipo}_{fecha_actual}.csv")
-                df.to_csv(ruta_csv, index=False)
-                print(f"Se ha guardado una versión CSV alternativa en: {ruta_csv}")
-            
-            # Mostrar resumen para este tipo
-            print(f"\nResumen de datos consolidados por {tipo}:")
-            print(f"- Total de registros: {len(df)}")
+            # Las estadísticas solo se calculan si se van a mostrar o guardar
+            estadisticas = None
+            if not args.quiet or args.estadisticas:
+                if comunes is None or not df.index.equals(indice_comunes):
+                    comunes = processor.generar_estadisticas_comunes(df)
+                    indice_comunes = df.index
+                    etaria = _distribucion_etaria(comunes["distribucion_grupo_etario"], len(df))
+                estadisticas = processor.generar_estadisticas(df, tipo, comunes=comunes)
+            pendientes.append((tipo, df, estadisticas, etaria))
+        
+        # Con --paralelo, cada tipo de consolidado se escribe en su propio proceso
+        futuros = None
+        if args.paralelo and len(pendientes) > 1:
+            with ProcessPoolExecutor(max_workers=len(pendientes)) as executor:
+                futuros = [
+                    executor.submit(_guardar_consolidado, tipo, df, estadisticas, etaria, args, meta_procesador, fecha_actual, fecha_generacion)
+                    for tipo, df, estadisticas, etaria in pendientes
+                ]
+        
+        # Sin --paralelo, la escritura va a un hilo de fondo mientras se arma el resumen
+        with ThreadPoolExecutor(max_workers=1) as hilo_escritura:
+            if futuros is None:
+                futuros = [
+                    hilo_escritura.submit(_guardar_consolidado, tipo, df, estadisticas, etaria, args, meta_procesador, fecha_actual, fecha_generacion)
+                    for tipo, df, estadisticas, etaria in pendientes
+                ]
             
-            if tipo == "vacunacion":
-                n_municipios = estadisticas.get("total_municipios", 0)
-                print(f"- Municipios de vacunación: {n_municipios}")
-                
-                # Mostrar top 5 municipios
-                top_municipios = sorted(estadisticas.get("municipios_vacunacion", {}).items(), 
-                                       key=lambda x: x[1], reverse=True)[:5]
-                if top_municipios:
-                    print("  Top 5 municipios por cantidad de registros:")
-                    for muni, count in top_municipios:
-                        print(f"    * {muni}: {count} registros")
-            else:
-                n_deptos = estadisticas.get("total_departamentos", 0)
-                n_municipios = estadisticas.get("total_municipios_residencia", 0)
-                
-                print(f"- Departamentos de residencia: {n_deptos}")
-                print(f"- Municipios de residencia: {n_municipios}")
+            for futuro, (tipo, df, estadisticas, etaria) in zip(futuros, pendientes):
+                resumen = [] if args.quiet else _lineas_resumen(tipo, len(df), estadisticas, etaria)
                 
-                # Mostrar top 5 departamentos
-                top_deptos = sorted(estadisticas.get("departamentos_residencia", {}).items(), 
-                                   key=lambda x: x[1], reverse=True)[:5]
-                if top_deptos:
-                    print("  Top 5 departamentos por cantidad de registros:")
-                    for depto, count in top_deptos:
-                        print(f"    * {depto}: {count} registros")
-            
-            if "total_vacunados" in estadisticas:
-                total_vacunados = estadisticas["total_vacunados"]
-                print(f"- Total de vacunaciones: {total_vacunados}")
+                # El resumen se arma en una lista y se escribe de una vez, tras los mensajes de guardado
+                lineas = futuro.result() + resumen
                 
-                # Desglose por tipo de dosis
-                if "tipos_dosis" in estadisticas:
-                    for nombre, info in estadisticas["tipos_dosis"].items():
-                        print(f"  - {nombre}: {info['total']} ({info['porcentaje']}%)")
-            
-            # Mostrar distribución por grupo etario
-            if "distribucion_grupo_etario" in estadisticas:
-                print("- Distribución por grupo etario:")
-                for grupo, count in sorted(estadisticas["distribucion_grupo_etario"].items()):
-                    porcentaje = count/len(df)*100
-                    print(f"  - {grupo}: {count} ({porcentaje:.1f}%)")
+                if lineas:
+                    sys.stdout.write("\n".join(lineas) + "\n")
     
     # Mostrar advertencias si las hay
     if processor.advertencias:
@@ -2,12 +2,14 @@
 Módulo para procesar y consolidar archivos PAI de vacunación.
 """
 import os
+import re
+import sys
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Tuple, Optional, Set
+from typing import List, Dict, Any, Tuple, Optional, Set, Union, Pattern
 from datetime import datetime
 import traceback
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, BrokenExecutor
 import multiprocessing
 from .utils import (
     listar_archivos_pai,
@@ -15,153 +17,483 @@ from .utils import (
     extraer_municipio_de_ruta,
     analizar_estructura_excel,
     leer_excel_con_estructura,
-    clasificar_grupo_etario,
-    limpiar_texto,
+    clasificar_grupo_etario_series,
+    GRUPOS_ETARIOS,
+    limpiar_texto_series,
+    quitar_tildes,
+    convertir_fechas,
     normalizar_nombres_columnas,
-    validar_normalizacion
+    limpiar_nombre_columna,
+    validar_normalizacion,
+    clave_cache_archivo,
+    leer_cache_archivo,
+    guardar_cache_archivo,
+    PYARROW_DISPONIBLE
 )
 
-def _procesar_archivo_worker_paralelo(ruta, modo_detallado=False):
+# Columnas normalizadas que se agregan a cada archivo y los términos que deben
+# aparecer todos en el encabezado original (en minúsculas)
+COLUMNAS_IDENTIFICACION = {
+    "Tipo_Identificacion": ("tipo", "identificacion"),
+    "Numero_Identificacion": ("numero", "identificacion", "cedula"),
+    "Primer_Nombre": ("primer", "nombre"),
+    "Primer_Apellido": ("primer", "apellido"),
+    "Sexo": ("sexo", "genero")
+}
+
+COLUMNAS_RESIDENCIA = {
+    "Departamento_Residencia": ("departamento", "residencia"),
+    "Municipio_Residencia": ("municipio", "residencia"),
+    "Localidad_Residencia": ("comuna", "localidad", "barrio")
+}
+
+def _patron_terminos(términos: Tuple[str, ...]) -> Pattern:
     """
-    Versión independiente de la función de procesamiento para uso en paralelo.
-    Esta función debe estar a nivel de módulo para que pueda ser serializada.
+    Compila una expresión que reconoce la primera línea que contiene todos los términos.
     
     Args:
-        ruta: Ruta al archivo a procesar.
-        modo_detallado: Si True, muestra información detallada.
+        términos: Textos que deben aparecer, en cualquier orden, en la misma línea.
         
     Returns:
-        Tuple con (DataFrame procesado, número de registros, advertencias)
+        Patrón multilínea con una búsqueda anticipada por término.
     """
-    try:
-        # Importaciones necesarias aquí para que la función sea autocontenida
-        import os
-        import pandas as pd
-        from .utils import (
-            extraer_municipio_de_ruta,
-            extraer_fecha_de_archivo,
-            analizar_estructura_excel,
-            leer_excel_con_estructura,
-            normalizar_nombres_columnas,
-            validar_normalizacion
-        )
-        
-        # Extraer información básica del archivo
-        municipio = extraer_municipio_de_ruta(ruta)
-        info_fecha = extraer_fecha_de_archivo(ruta)
+    anticipadas = "".join(f"(?=[^\\n]*{re.escape(term)})" for term in términos)
+    return re.compile(f"^{anticipadas}", re.MULTILINE)
+
+# Patrones precompilados de todas las columnas que se buscan en cada archivo, aplicados
+# sobre los nombres de las columnas unidos en un solo texto (un nombre por línea): la fecha
+# de atención, los datos de identificación y de residencia, y la edad ("año" o "edad")
+PATRONES_COLUMNAS = {
+    "Fecha": _patron_terminos(("fecha", "atencion")),
+    **{col: _patron_terminos(t) for col, t in COLUMNAS_IDENTIFICACION.items()},
+    **{col: _patron_terminos(t) for col, t in COLUMNAS_RESIDENCIA.items()},
+    "Edad_Num": re.compile(r"^[^\n]*(?:año|edad)", re.MULTILINE)
+}
+
+# Columnas de baja cardinalidad que se guardan como categóricas
+COLUMNAS_CATEGORICAS = ("Municipio_Vacunacion", "Departamento_Residencia", "Municipio_Residencia",
+                        "Localidad_Residencia", "Archivo_Origen", "Tipo_Identificacion", "Sexo")
+
+# Columnas indicadoras de filtrar_por_vacuna y el texto que las activa en Tipo_Dosis
+DOSIS_INDICADORAS = {
+    "Es_Primera_Dosis": "PRIMERA",
+    "Es_Segunda_Dosis": "SEGUNDA",
+    "Es_Refuerzo": "REFUERZO",
+    "Es_Unica_Dosis": "UNICA"
+}
+
+def _nombre_columna_minusculas(col: Any) -> str:
+    """
+    Texto en minúsculas de un nombre de columna para buscar palabras clave.
+    
+    Args:
+        col: Nombre de columna (texto o tupla de encabezados jerárquicos).
         
-        if modo_detallado:
-            print(f"Procesando archivo: {os.path.basename(ruta)}")
+    Returns:
+        Nombre en minúsculas; en las tuplas se unen los niveles no nulos con espacios.
+    """
+    if isinstance(col, tuple):
+        return " ".join([str(parte) for parte in col if pd.notna(parte)]).lower()
+    return str(col).lower()
+
+def _texto_columnas(columnas: Any) -> str:
+    """
+    Índice de texto de las columnas de un DataFrame para buscar palabras clave.
+    
+    Se arma una sola vez por DataFrame y sirve para todas las búsquedas.
+    
+    Args:
+        columnas: Columnas del DataFrame.
         
-        # Analizar estructura del archivo
-        estructura = analizar_estructura_excel(ruta, forzar_jerarquico=True)
+    Returns:
+        Nombres en minúsculas (ver _nombre_columna_minusculas), uno por línea.
+    """
+    return "\n".join(_nombre_columna_minusculas(col).replace("\n", " ") for col in columnas)
+
+def _buscar_columnas(texto_columnas: str, patrones: Dict[str, Pattern]) -> Dict[str, int]:
+    """
+    Busca la primera columna que cumple cada patrón con una sola búsqueda por patrón.
+    
+    Args:
+        texto_columnas: Índice de texto de las columnas (ver _texto_columnas).
+        patrones: Patrones por nombre de columna normalizada.
         
-        # Leer el archivo con la estructura adecuada
-        df, es_jerarquico = leer_excel_con_estructura(ruta, estructura)
+    Returns:
+        Diccionario con la posición de la columna encontrada para cada columna normalizada.
+    """
+    encontradas = {}
+    for col_norm, patron in patrones.items():
+        coincidencia = patron.search(texto_columnas)
+        if coincidencia:
+            encontradas[col_norm] = texto_columnas.count("\n", 0, coincidencia.start())
+    return encontradas
+
+def _grupo_etario_no_especificado(filas: int) -> pd.Categorical:
+    """
+    Grupo etario "No especificado" para todas las filas de un archivo sin edad.
+    
+    Usa las mismas categorías que clasificar_grupo_etario_series para que pd.concat
+    conserve la columna categórica al combinarla con archivos que sí tienen edad.
+    
+    Args:
+        filas: Número de filas del archivo.
         
-        # Normalizar nombres de columnas
-        df = normalizar_nombres_columnas(df)
-        df = validar_normalizacion(df)
-            
-        # Añadir columnas de información adicional
-        df["Municipio_Vacunacion"] = municipio
-        df["Año_Registro"] = info_fecha.get("año")
-        df["Mes_Registro"] = info_fecha.get("mes")
-        df["Archivo_Origen"] = os.path.basename(ruta)
-        
-        # Intentar detectar y limpiar información clave
-        # 1. Fecha de atención/aplicación
-        columnas_fecha = []
-        for col in df.columns:
-            # Comprobar si es string porque ya hemos normalizado
-            if isinstance(col, str) and "fecha" in col.lower() and "atencion" in col.lower():
-                columnas_fecha.append(col)
+    Returns:
+        Categórico con un código por fila.
+    """
+    codigos = np.full(filas, len(GRUPOS_ETARIOS) - 1, dtype=np.int8)
+    return pd.Categorical.from_codes(codigos, categories=GRUPOS_ETARIOS)
 
-        if columnas_fecha:
-            col_fecha = columnas_fecha[0]
-            df = df[df[col_fecha].notna()]  # Eliminar filas sin fecha
-            try:
-                df["Fecha"] = pd.to_datetime(df[col_fecha], errors="coerce")
-            except Exception as e:
-                pass
-        else:
-            # Si no hay columna de fecha, usar la fecha del archivo
-            if info_fecha["año"] and info_fecha["mes"]:
-                fecha_str = f"{info_fecha['año']}-{info_fecha['mes']}-01"
-                df["Fecha"] = pd.to_datetime(fecha_str)
-            else:
-                df["Fecha"] = pd.NaT
+def _textos_a_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte a texto respaldado por pyarrow las columnas que solo contienen texto.
+    
+    Un objeto de Python por celda ocupa varias veces el tamaño del texto y pd.concat
+    copia cada referencia; con pyarrow el texto queda en buffers contiguos que se
+    concatenan como trozos. Las columnas con valores de otros tipos (números, fechas)
+    se dejan como están para no alterar los datos.
+    
+    Args:
+        df: DataFrame de un archivo procesado.
+        
+    Returns:
+        El mismo DataFrame con las columnas de texto convertidas.
+    """
+    if not PYARROW_DISPONIBLE:
+        return df
+    
+    for col in df.columns[(df.dtypes == object).to_numpy()]:
+        if pd.api.types.infer_dtype(df[col], skipna=True) == "string":
+            df[col] = df[col].astype("string[pyarrow]")
+    return df
 
-        # 2. Datos de identificación personal
-        columnas_id = {
-            "Tipo_Identificacion": ["tipo", "identificacion"],
-            "Numero_Identificacion": ["numero", "identificacion", "cedula"],
-            "Primer_Nombre": ["primer", "nombre"],
-            "Primer_Apellido": ["primer", "apellido"],
-            "Sexo": ["sexo", "genero"]
-        }
+def _procesar_archivo_pai(ruta_archivo: str, modo_detallado: bool = False,
+                          advertencias: Optional[List[str]] = None,
+                          motor_excel: Optional[str] = None) -> pd.DataFrame:
+    """
+    Procesa un archivo PAI y extrae todos los datos.
+    Está a nivel de módulo para poder ejecutarse en procesos independientes;
+    los contadores del procesador se actualizan en quien la llama.
+    
+    Args:
+        ruta_archivo: Ruta al archivo XLSM/XLSX.
+        modo_detallado: Si True, muestra información detallada.
+        advertencias: Lista donde se agregan las advertencias del archivo (opcional).
+        motor_excel: Motor de lectura de Excel (None = automático).
         
-        for col_norm, términos in columnas_id.items():
-            for col in df.columns:
-                # Comprobar solo string ya que hemos normalizado
-                col_str = str(col).lower()
-                if all(term in col_str for term in términos):
-                    df[col_norm] = df[col]
-                    break
-        
-        # 3. Datos de residencia
-        columnas_residencia = {
-            "Departamento_Residencia": ["departamento", "residencia"],
-            "Municipio_Residencia": ["municipio", "residencia"],
-            "Localidad_Residencia": ["comuna", "localidad", "barrio"]
-        }
+    Returns:
+        DataFrame con los datos procesados.
+    """
+    if advertencias is None:
+        advertencias = []
+    
+    # El detalle de cada archivo se acumula y se escribe de una sola vez: menos
+    # escrituras a la consola y sin mezclar líneas de procesos en paralelo
+    detalle = [] if modo_detallado else None
+    try:
+        return _extraer_datos_archivo(ruta_archivo, advertencias, detalle, motor_excel)
+    finally:
+        if detalle:
+            sys.stdout.write("".join(f"{linea}\n" for linea in detalle))
+            sys.stdout.flush()
+
+def _extraer_datos_archivo(ruta_archivo: str, advertencias: List[str],
+                           detalle: Optional[List[str]] = None,
+                           motor_excel: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lee un archivo PAI y detecta sus columnas clave (ver _procesar_archivo_pai).
+    
+    Args:
+        ruta_archivo: Ruta al archivo XLSM/XLSX.
+        advertencias: Lista donde se agregan las advertencias del archivo.
+        detalle: Lista donde se agregan las líneas de información detallada (None = sin detalle).
+        motor_excel: Motor de lectura de Excel (None = automático).
         
-        for col_norm, términos in columnas_residencia.items():
-            for col in df.columns:
-                col_str = str(col).lower()
-                if all(term in col_str for term in términos):
-                    df[col_norm] = df[col].apply(lambda x: limpiar_texto(x) if pd.notna(x) else None)
-                    break
-        
-        # 4. Clasificar por grupo etario
-        columnas_edad = []
-        for col in df.columns:
-            col_str = str(col).lower()
-            if "año" in col_str or "edad" in col_str:
-                columnas_edad.append(col)
-                
-        if columnas_edad:
-            col_edad = columnas_edad[0]
-            try:
-                df["Edad_Num"] = pd.to_numeric(df[col_edad], errors="coerce")
-                df["Grupo_Etario"] = df["Edad_Num"].apply(clasificar_grupo_etario)
-            except Exception:
-                df["Grupo_Etario"] = "No especificado"
+    Returns:
+        DataFrame con los datos procesados.
+    """
+    # Extraer información básica del archivo
+    municipio = extraer_municipio_de_ruta(ruta_archivo)
+    info_fecha = extraer_fecha_de_archivo(ruta_archivo)
+    
+    if detalle is not None:
+        detalle.append(f"Procesando archivo: {os.path.basename(ruta_archivo)}")
+        detalle.append(f"  - Municipio identificado: {municipio}")
+        detalle.append(f"  - Año: {info_fecha['año'] or 'No identificado'}")
+        detalle.append(f"  - Mes: {info_fecha['mes'] or 'No identificado'}")
+    
+    # Analizar estructura del archivo
+    estructura = analizar_estructura_excel(ruta_archivo, forzar_jerarquico=True, motor=motor_excel)
+    
+    if estructura["error"]:
+        advertencias.append(f"Error al analizar estructura: {estructura['error']}")
+        if detalle is not None:
+            detalle.append(f"  - {advertencias[-1]}")
+        
+        # Sin hoja seleccionada el libro no se pudo abrir (o no tiene hojas):
+        # leerlo completo fallaría igual, así que se descarta sin más lecturas
+        if not estructura["hoja_seleccionada"]:
+            raise ValueError(estructura["error"])
+    
+    if detalle is not None:
+        if estructura["modo_jerarquico"]:
+            detalle.append(f"  - Archivo con estructura jerárquica detectada")
+            detalle.append(f"  - Categorías principales: {list(estructura['categorias_detectadas'].keys())}")
+        else:
+            detalle.append(f"  - Archivo con estructura plana (no jerárquica)")
+            detalle.append(f"  - Encabezado en fila {estructura['filas_encabezado'][0] + 1}")
+    
+    # Leer el archivo con la estructura adecuada
+    df, es_jerarquico = leer_excel_con_estructura(ruta_archivo, estructura)
+    
+    if detalle is not None:
+        detalle.append(f"  - Archivo leído exitosamente: {len(df)} filas, {len(df.columns)} columnas")
+    
+    # Normalizar nombres de columnas (especialmente para encabezados jerárquicos)
+    df = normalizar_nombres_columnas(df)
+    df = validar_normalizacion(df)
+    
+    if detalle is not None:
+        detalle.append(f"  - Nombres de columnas normalizados y validados")
+        
+    # Añadir columnas de información adicional
+    # Columnas de baja cardinalidad como categóricas desde el origen (un código por fila)
+    df["Municipio_Vacunacion"] = pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [municipio])
+    df["Año_Registro"] = info_fecha.get("año")
+    df["Mes_Registro"] = info_fecha.get("mes")
+    df["Archivo_Origen"] = pd.Categorical.from_codes(
+        np.zeros(len(df), dtype=np.int8), [os.path.basename(ruta_archivo)]
+    )
+    
+    # Todas las columnas clave se ubican de una vez sobre el índice de texto de las columnas
+    # (las columnas que se agregan a continuación no coinciden con ningún criterio; se
+    # usan posiciones porque no cambian al filtrar filas ni al agregar columnas al final)
+    posiciones = _buscar_columnas(_texto_columnas(df.columns), PATRONES_COLUMNAS)
+    
+    # Intentar detectar y limpiar información clave
+    # 1. Fecha de atención/aplicación
+    if "Fecha" in posiciones:
+        col_fecha = df.columns[posiciones["Fecha"]]
+        # Eliminar filas sin fecha y la fila de cierre "fin" con una sola máscara
+        fechas = df[col_fecha]
+        con_fecha = fechas.notna().to_numpy() & fechas.ne("fin").to_numpy()
+        df = df.take(np.flatnonzero(con_fecha))
+        try:
+            df["Fecha"] = convertir_fechas(df[col_fecha])
+        except Exception as e:
+            advertencias.append(f"Error al convertir fechas: {str(e)}")
+            if detalle is not None:
+                detalle.append(f"  - {advertencias[-1]}")
+    else:
+        # Si no hay columna de fecha, usar la fecha del archivo
+        if info_fecha["año"] and info_fecha["mes"]:
+            fecha_str = f"{info_fecha['año']}-{info_fecha['mes']}-01"
+            df["Fecha"] = pd.to_datetime(fecha_str)
         else:
-            df["Grupo_Etario"] = "No especificado"
+            df["Fecha"] = pd.NaT
+    
+    # 2. Datos de identificación personal
+    for col_norm in COLUMNAS_IDENTIFICACION:
+        if col_norm in posiciones:
+            valores = df.iloc[:, posiciones[col_norm]]
+            df[col_norm] = valores.astype("category") if col_norm in COLUMNAS_CATEGORICAS else valores
+    
+    # 3. Datos de residencia
+    mapeo_residencia = {
+        col_norm: df.columns[posiciones[col_norm]]
+        for col_norm in COLUMNAS_RESIDENCIA if col_norm in posiciones
+    }
+    
+    if mapeo_residencia:
+        # Limpiar todas las columnas de residencia en una sola pasada: apiladas en una
+        # serie, los nombres repetidos entre columnas se normalizan una sola vez
+        bloque = pd.concat([df[col] for col in mapeo_residencia.values()], ignore_index=True)
+        limpio = limpiar_texto_series(bloque).to_numpy().reshape(len(mapeo_residencia), len(df))
+        for col_norm, valores in zip(mapeo_residencia, limpio):
+            df[col_norm] = pd.Categorical(valores) if col_norm in COLUMNAS_CATEGORICAS else valores
+    
+    # 4. Clasificar por grupo etario
+    posicion_edad = posiciones.get("Edad_Num")
+    
+    if posicion_edad is not None:
+        # errors="coerce" deja en NaN lo que no es número (y esas filas quedan como
+        # "No especificado"); por posición se obtiene una serie aunque el nombre se repita.
+        # Se deja en float64: float32 altera las edades con decimales (1.1 -> 1.100000023...)
+        # y puede mover un valor al grupo vecino en los límites
+        try:
+            df["Edad_Num"] = pd.to_numeric(df.iloc[:, posicion_edad], errors="coerce")
+            df["Grupo_Etario"] = clasificar_grupo_etario_series(df["Edad_Num"])
+        except Exception as e:
+            advertencias.append(f"Error al calcular grupos etarios: {str(e)}")
+            if detalle is not None:
+                detalle.append(f"  - {advertencias[-1]}")
+            df["Grupo_Etario"] = _grupo_etario_no_especificado(len(df))
+    else:
+        df["Grupo_Etario"] = _grupo_etario_no_especificado(len(df))
+    
+    # Texto en pyarrow: menos memoria por archivo y una concatenación más barata
+    return _textos_a_arrow(df)
+
+def _procesar_archivo_con_cache(ruta_archivo: str, modo_detallado: bool = False,
+                               advertencias: Optional[List[str]] = None,
+                               directorio_cache: Optional[str] = None,
+                               motor_excel: Optional[str] = None) -> pd.DataFrame:
+    """
+    Procesa un archivo PAI reutilizando el resultado guardado en caché si el
+    archivo no cambió desde la última ejecución.
+    
+    Args:
+        ruta_archivo: Ruta al archivo XLSM/XLSX.
+        modo_detallado: Si True, muestra información detallada.
+        advertencias: Lista donde se agregan las advertencias del archivo (opcional).
+        directorio_cache: Directorio de la caché (None = sin caché).
+        motor_excel: Motor de lectura de Excel (None = automático).
         
-        # Devolver DataFrame y número de registros
-        return df, len(df), []  # DataFrame, num_registros, advertencias
+    Returns:
+        DataFrame con los datos procesados.
+    """
+    if advertencias is None:
+        advertencias = []
+    
+    if not directorio_cache:
+        return _procesar_archivo_pai(ruta_archivo, modo_detallado, advertencias, motor_excel)
+    
+    # Otro motor puede leer tipos distintos (p. ej. fechas), así que forma parte de la clave
+    clave = clave_cache_archivo(ruta_archivo, motor_excel)
+    entrada = leer_cache_archivo(directorio_cache, clave)
+    if entrada is not None:
+        df, advertencias_previas = entrada
+        advertencias.extend(advertencias_previas)
+        if modo_detallado:
+            print(f"Archivo sin cambios, usando caché: {os.path.basename(ruta_archivo)}")
+        return df
+    
+    df = _procesar_archivo_pai(ruta_archivo, modo_detallado, advertencias, motor_excel)
+    try:
+        guardar_cache_archivo(directorio_cache, clave, df, advertencias)
+    except Exception as e:
+        # La caché es opcional: un fallo al escribirla no invalida el resultado
+        if modo_detallado:
+            print(f"  - No se pudo guardar en caché: {str(e)}")
+    return df
+
+def _procesar_archivo_worker_paralelo(ruta, modo_detallado=False, directorio_cache=None, motor_excel=None):
+    """
+    Envoltorio de _procesar_archivo_pai para uso en paralelo: nunca lanza excepciones.
+    
+    Args:
+        ruta: Ruta al archivo a procesar.
+        modo_detallado: Si True, muestra información detallada.
+        directorio_cache: Directorio de la caché (None = sin caché).
+        motor_excel: Motor de lectura de Excel (None = automático).
+        
+    Returns:
+        Tuple con (DataFrame procesado, número de registros, advertencias)
+    """
+    advertencias = []
+    try:
+        df = _procesar_archivo_con_cache(ruta, modo_detallado, advertencias, directorio_cache, motor_excel)
+        return df, len(df), advertencias
     except Exception as e:
         # Capturar cualquier error para no detener el proceso
-        error_msg = f"Error al procesar {os.path.basename(ruta)}: {str(e)}"
-        return pd.DataFrame(), 0, [error_msg]
+        advertencias.append(f"Error al procesar {os.path.basename(ruta)}: {str(e)}")
+        return pd.DataFrame(), 0, advertencias
+
+def _procesadores_disponibles() -> int:
+    """
+    Número de procesadores que este proceso puede usar.
+    
+    multiprocessing.cpu_count() cuenta todos los del equipo aunque el proceso esté
+    limitado a menos (contenedores, taskset); crear más procesos que núcleos
+    disponibles solo agrega cambios de contexto y memoria.
+    
+    Returns:
+        Número de procesadores utilizables (al menos 1).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, multiprocessing.cpu_count())
+
+def _concatenar_dataframes(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatena DataFrames conservando las columnas categóricas.
+    
+    pd.concat convierte a object una columna categórica cuyas categorías difieren
+    entre archivos (p. ej. Municipio_Vacunacion); antes de concatenar se les asigna
+    a todas la unión de categorías, que solo reasigna los códigos.
+    
+    Args:
+        dfs: Lista de DataFrames a concatenar.
+        
+    Returns:
+        DataFrame concatenado con índice nuevo.
+    """
+    if len(dfs) > 1:
+        for col in dfs[0].columns:
+            columnas = [df[col] for df in dfs if col in df.columns]
+            if len(columnas) < len(dfs) or not all(isinstance(c.dtype, pd.CategoricalDtype) for c in columnas):
+                continue
+            
+            categorias = pd.Index(pd.unique(np.concatenate([c.cat.categories.to_numpy() for c in columnas])))
+            alineados = []
+            for df in dfs:
+                if not df[col].cat.categories.equals(categorias):
+                    # Copia superficial: solo se reemplaza esta columna
+                    df = df.copy(deep=False)
+                    df[col] = df[col].cat.set_categories(categorias)
+                alineados.append(df)
+            dfs = alineados
+    
+    return pd.concat(dfs, ignore_index=True)
+
+def _contar_valores(serie: pd.Series, ordenar_claves: bool = False) -> Dict[Any, int]:
+    """
+    Cuenta las ocurrencias de cada valor no nulo de una serie en una sola pasada.
+    
+    Args:
+        serie: Serie a contar.
+        ordenar_claves: Si True, ordena el resultado por valor en lugar de por frecuencia.
+        
+    Returns:
+        Diccionario {valor: conteo} ordenado de mayor a menor frecuencia.
+    """
+    conteos = serie.value_counts(dropna=True)
+    # Las series categóricas incluyen categorías sin ocurrencias
+    conteos = conteos[conteos > 0]
+    if ordenar_claves:
+        conteos = conteos.sort_index()
+    return dict(zip(conteos.index.tolist(), conteos.tolist()))
 
 class PaiProcessor:
     """
     Clase para procesar archivos PAI de vacunación.
     """
     
-    def __init__(self, modo_detallado: bool = False, ignorar_errores: bool = False):
+    def __init__(self, modo_detallado: bool = False, ignorar_errores: bool = False,
+                 directorio_cache: Optional[str] = None, motor_excel: Optional[str] = None,
+                 mostrar_progreso: bool = True, usar_hilos: bool = False):
         """
         Inicializa el procesador de archivos PAI.
         
         Args:
             modo_detallado: Si True, muestra información detallada durante el procesamiento.
             ignorar_errores: Si True, continúa procesando aunque haya archivos con errores.
+            directorio_cache: Directorio donde guardar los archivos ya procesados para
+                reutilizarlos mientras no cambien (None = sin caché).
+            motor_excel: Motor de pandas para leer los archivos Excel ("calamine",
+                "openpyxl", "xlrd"); None elige calamine si está instalado.
+            mostrar_progreso: Si False, omite las líneas de progreso por archivo y por lote
+                (los errores, advertencias y totales se siguen mostrando).
+            usar_hilos: Si True, el procesamiento paralelo usa hilos en lugar de procesos
+                (sin arranque de procesos ni copia de resultados entre ellos; rinde cuando
+                la lectura con calamine, que libera el GIL, domina el tiempo).
         """
         self.modo_detallado = modo_detallado
         self.ignorar_errores = ignorar_errores
+        self.directorio_cache = directorio_cache
+        self.motor_excel = motor_excel
+        self.mostrar_progreso = mostrar_progreso
+        self.usar_hilos = usar_hilos
         self.archivos_procesados = 0
         self.registros_totales = 0
         self.advertencias = []
@@ -197,147 +529,10 @@ class PaiProcessor:
         """
         advertencias_archivo = []
         try:
-            # Extraer información básica del archivo
-            municipio = extraer_municipio_de_ruta(ruta_archivo)
-            info_fecha = extraer_fecha_de_archivo(ruta_archivo)
-            
-            if self.modo_detallado:
-                print(f"Procesando archivo: {os.path.basename(ruta_archivo)}")
-                print(f"  - Municipio identificado: {municipio}")
-                print(f"  - Año: {info_fecha['año'] or 'No identificado'}")
-                print(f"  - Mes: {info_fecha['mes'] or 'No identificado'}")
-            
-            # Analizar estructura del archivo
-            estructura = analizar_estructura_excel(ruta_archivo, forzar_jerarquico=True)
-            
-            if estructura["error"]:
-                advertencias_archivo.append(f"Error al analizar estructura: {estructura['error']}")
-                if self.modo_detallado:
-                    print(f"  - {advertencias_archivo[-1]}")
-            
-            if self.modo_detallado:
-                if estructura["modo_jerarquico"]:
-                    print(f"  - Archivo con estructura jerárquica detectada")
-                    print(f"  - Categorías principales: {list(estructura['categorias_detectadas'].keys())}")
-                else:
-                    print(f"  - Archivo con estructura plana (no jerárquica)")
-                    print(f"  - Encabezado en fila {estructura['filas_encabezado'][0] + 1}")
-            
-            # Leer el archivo con la estructura adecuada
-            df, es_jerarquico = leer_excel_con_estructura(ruta_archivo, estructura)
-            
-            if self.modo_detallado:
-                print(f"  - Archivo leído exitosamente: {len(df)} filas, {len(df.columns)} columnas")
-            
-            # Normalizar nombres de columnas (especialmente para encabezados jerárquicos)
-            df = normalizar_nombres_columnas(df)
-            df = validar_normalizacion(df)
-            
-            if self.modo_detallado:
-                print(f"  - Nombres de columnas normalizados y validados")
-                
-            # Añadir columnas de información adicional
-            df["Municipio_Vacunacion"] = municipio
-            df["Año_Registro"] = info_fecha.get("año")
-            df["Mes_Registro"] = info_fecha.get("mes")
-            df["Archivo_Origen"] = os.path.basename(ruta_archivo)
-            
-            # Intentar detectar y limpiar información clave
-            # 1. Fecha de atención/aplicación
-            columnas_fecha = []
-            for col in df.columns:
-                # Comprobar si la columna es una tupla (encabezados jerárquicos) o string
-                if isinstance(col, tuple):
-                    # Para encabezados jerárquicos, verificar ambos niveles de encabezado
-                    col_str = " ".join([str(parte) for parte in col if pd.notna(parte)])
-                    if "fecha" in col_str.lower() and "atencion" in col_str.lower():
-                        columnas_fecha.append(col)
-                else:
-                    # Para encabezados simples (strings)
-                    if "fecha" in str(col).lower() and "atencion" in str(col).lower():
-                        columnas_fecha.append(col)
-
-            if columnas_fecha:
-                col_fecha = columnas_fecha[0]
-                df = df[df[col_fecha].notna()]  # Eliminar filas sin fecha
-                try:
-                    df["Fecha"] = pd.to_datetime(df[col_fecha], errors="coerce")
-                except Exception as e:
-                    advertencias_archivo.append(f"Error al convertir fechas: {str(e)}")
-                    if self.modo_detallado:
-                        print(f"  - {advertencias_archivo[-1]}")
-            else:
-                # Si no hay columna de fecha, usar la fecha del archivo
-                if info_fecha["año"] and info_fecha["mes"]:
-                    fecha_str = f"{info_fecha['año']}-{info_fecha['mes']}-01"
-                    df["Fecha"] = pd.to_datetime(fecha_str)
-                else:
-                    df["Fecha"] = pd.NaT
-            
-            # 2. Datos de identificación personal
-            columnas_id = {
-                "Tipo_Identificacion": ["tipo", "identificacion"],
-                "Numero_Identificacion": ["numero", "identificacion", "cedula"],
-                "Primer_Nombre": ["primer", "nombre"],
-                "Primer_Apellido": ["primer", "apellido"],
-                "Sexo": ["sexo", "genero"]
-            }
-            
-            for col_norm, términos in columnas_id.items():
-                for col in df.columns:
-                    # Comprobar si es una tupla o string
-                    if isinstance(col, tuple):
-                        col_str = " ".join([str(parte) for parte in col if pd.notna(parte)]).lower()
-                    else:
-                        col_str = str(col).lower()
-                        
-                    if all(term in col_str for term in términos):
-                        df[col_norm] = df[col]
-                        break
-            
-            # 3. Datos de residencia
-            columnas_residencia = {
-                "Departamento_Residencia": ["departamento", "residencia"],
-                "Municipio_Residencia": ["municipio", "residencia"],
-                "Localidad_Residencia": ["comuna", "localidad", "barrio"]
-            }
-            
-            for col_norm, términos in columnas_residencia.items():
-                for col in df.columns:
-                    # Comprobar si es una tupla o string
-                    if isinstance(col, tuple):
-                        col_str = " ".join([str(parte) for parte in col if pd.notna(parte)]).lower()
-                    else:
-                        col_str = str(col).lower()
-                        
-                    if all(term in col_str for term in términos):
-                        df[col_norm] = df[col].apply(lambda x: limpiar_texto(x) if pd.notna(x) else None)
-                        break
-            
-            # 4. Clasificar por grupo etario
-            columnas_edad = []
-            for col in df.columns:
-                # Comprobar si es una tupla o string
-                if isinstance(col, tuple):
-                    col_str = " ".join([str(parte) for parte in col if pd.notna(parte)]).lower()
-                else:
-                    col_str = str(col).lower()
-                    
-                if "año" in col_str or "edad" in col_str:
-                    columnas_edad.append(col)
-                    
-            if columnas_edad:
-                col_edad = columnas_edad[0]
-                try:
-                    df["Edad_Num"] = pd.to_numeric(df[col_edad], errors="coerce")
-                    df["Grupo_Etario"] = df["Edad_Num"].apply(clasificar_grupo_etario)
-                except Exception as e:
-                    advertencias_archivo.append(f"Error al calcular grupos etarios: {str(e)}")
-                    if self.modo_detallado:
-                        print(f"  - {advertencias_archivo[-1]}")
-                    df["Grupo_Etario"] = "No especificado"
-            else:
-                df["Grupo_Etario"] = "No especificado"
+            df = _procesar_archivo_con_cache(
+                ruta_archivo, self.modo_detallado, advertencias_archivo,
+                self.directorio_cache, self.motor_excel
+            )
             
             # Actualizar contador de registros
             registros = len(df)
@@ -380,9 +575,10 @@ class PaiProcessor:
         """
         # Determinar número óptimo de workers
         if max_workers is None:
-            max_workers = min(multiprocessing.cpu_count(), len(archivos))
+            max_workers = min(_procesadores_disponibles(), len(archivos))
         
-        print(f"Procesando {len(archivos)} archivos en paralelo con {max_workers} procesos...")
+        unidad = "hilos" if self.usar_hilos else "procesos"
+        print(f"Procesando {len(archivos)} archivos en paralelo con {max_workers} {unidad}...")
         
         # Función para normalizar tipos en un DataFrame
         def normalizar_tipos(df):
@@ -392,7 +588,7 @@ class PaiProcessor:
                 # Normalizar columnas de fecha
                 if 'fecha' in col_str and df[col].dtype != 'datetime64[ns]':
                     try:
-                        df[col] = pd.to_datetime(df[col], errors='coerce')
+                        df[col] = convertir_fechas(df[col])
                     except:
                         pass
             return df
@@ -401,89 +597,121 @@ class PaiProcessor:
         lotes = [archivos[i:i + batch_size] for i in range(0, len(archivos), batch_size)]
         print(f"Dividiendo procesamiento en {len(lotes)} lotes de hasta {batch_size} archivos")
         
-        # DataFrame final consolidado
-        df_final = None
+        # DataFrames combinados de cada lote (se concatenan una sola vez al final)
+        lotes_combinados = []
         
-        # Procesar archivos por lotes
-        for num_lote, lote_archivos in enumerate(lotes, 1):
-            print(f"\nProcesando lote {num_lote}/{len(lotes)} ({len(lote_archivos)} archivos)")
-            
-            # Lista para almacenar resultados del lote
-            resultados_lote = []
-            
-            # Usar ProcessPoolExecutor para procesamiento paralelo
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                # Enviar trabajos - utilizando la función a nivel de módulo
-                futuros = {executor.submit(
-                    _procesar_archivo_worker_paralelo, 
-                    archivo, 
-                    self.modo_detallado
-                ): archivo for archivo in lote_archivos}
+        # Un solo pool para todos los lotes: los procesos (o hilos) se crean una vez y se
+        # reutilizan. Si el pool se rompe (p. ej. el sistema termina un proceso por falta de
+        # memoria) deja de aceptar trabajos: se reemplaza por uno nuevo en el lote siguiente
+        # (los hilos comparten memoria: los DataFrames no se serializan de vuelta)
+        ejecutor = ThreadPoolExecutor if self.usar_hilos else ProcessPoolExecutor
+        executor = None
+        try:
+            # Procesar archivos por lotes
+            for num_lote, lote_archivos in enumerate(lotes, 1):
+                if self.mostrar_progreso:
+                    print(f"\nProcesando lote {num_lote}/{len(lotes)} ({len(lote_archivos)} archivos)")
+                
+                # Lista para almacenar resultados del lote
+                resultados_lote = []
+                
+                if executor is None:
+                    executor = ejecutor(max_workers=max_workers)
+                futuros = [
+                    executor.submit(
+                        _procesar_archivo_worker_paralelo, archivo,
+                        self.modo_detallado, self.directorio_cache, self.motor_excel
+                    )
+                    for archivo in lote_archivos
+                ]
                 
-                # Procesar resultados a medida que se completan
-                for i, futuro in enumerate(as_completed(futuros), 1):
-                    archivo = futuros[futuro]
+                # Resultados en el orden de los archivos
+                for i, (archivo, futuro) in enumerate(zip(lote_archivos, futuros), 1):
                     try:
                         df, num_registros, advertencias_archivo = futuro.result()
-                        
-                        if not df.empty:
-                            # Normalizar tipos de datos
-                            df = normalizar_tipos(df)
-                            resultados_lote.append(df)
-                            self.archivos_procesados += 1
-                            self.registros_totales += num_registros
-                            print(f"[{i}/{len(lote_archivos)}] Procesado: {os.path.basename(archivo)} ({num_registros} registros)")
-                        else:
-                            print(f"[{i}/{len(lote_archivos)}] Sin datos: {os.path.basename(archivo)}")
-                        
-                        # Registrar advertencias
-                        for adv in advertencias_archivo:
-                            self.advertencias.append(adv)
-                            if self.modo_detallado:
-                                print(f"  - {adv}")
-                        
                     except Exception as e:
+                        # El worker ya captura sus errores: lo que llega aquí viene del pool
+                        # (proceso terminado, resultado que no se pudo deserializar). Se
+                        # registra y se siguen procesando los demás archivos
+                        if isinstance(e, BrokenExecutor) and executor is not None:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            executor = None
                         error_msg = f"Error al procesar {os.path.basename(archivo)}: {str(e)}"
                         self.advertencias.append(error_msg)
+                        self._agregar_info_archivo(archivo, 0, [error_msg])
                         print(f"[{i}/{len(lote_archivos)}] {error_msg}")
-            
-            # Combinar los DataFrames del lote actual
-            if resultados_lote:
-                print(f"Combinando {len(resultados_lote)} archivos del lote {num_lote}...")
-                try:
-                    # Asegurar que todos los DataFrames tengan las mismas columnas
-                    columnas_comunes = set.intersection(*[set(df.columns) for df in resultados_lote])
-                    print(f"  Usando {len(columnas_comunes)} columnas comunes")
+                        continue
                     
-                    # Utilizar solo columnas comunes para concatenar
-                    resultados_filtrados = [df[list(columnas_comunes)] for df in resultados_lote]
-                    df_lote = pd.concat(resultados_filtrados, ignore_index=True)
+                    if not df.empty:
+                        # Normalizar tipos de datos
+                        df = normalizar_tipos(df)
+                        resultados_lote.append(df)
+                        self.archivos_procesados += 1
+                        self.registros_totales += num_registros
+                        if self.mostrar_progreso:
+                            print(f"[{i}/{len(lote_archivos)}] Procesado: {os.path.basename(archivo)} ({num_registros} registros)")
+                    elif self.mostrar_progreso:
+                        print(f"[{i}/{len(lote_archivos)}] Sin datos: {os.path.basename(archivo)}")
                     
-                    # Concatenar con el DataFrame final
-                    if df_final is None:
-                        df_final = df_lote
-                    else:
-                        # Asegurar columnas compatibles entre lotes
-                        columnas_finales = set(df_final.columns)
-                        columnas_lote = set(df_lote.columns)
-                        columnas_compatibles = list(columnas_finales.intersection(columnas_lote))
+                    # Cada proceso devuelve sus propias advertencias y registros, sin estado
+                    # compartido: se fusionan aquí, como en el modo secuencial
+                    self.advertencias.extend(advertencias_archivo)
+                    self._agregar_info_archivo(archivo, num_registros, advertencias_archivo)
+                    if self.modo_detallado:
+                        for adv in advertencias_archivo:
+                            print(f"  - {adv}")
+                
+                # Combinar los DataFrames del lote actual
+                if resultados_lote:
+                    if self.mostrar_progreso:
+                        print(f"Combinando {len(resultados_lote)} archivos del lote {num_lote}...")
+                    try:
+                        # Asegurar que todos los DataFrames tengan las mismas columnas, en el orden
+                        # del primer archivo (un set se consulta en O(1) pero no conserva el orden)
+                        otras_columnas = [set(df.columns) for df in resultados_lote[1:]]
+                        columnas_comunes = [
+                            col for col in resultados_lote[0].columns
+                            if all(col in columnas for columnas in otras_columnas)
+                        ]
+                        if self.mostrar_progreso:
+                            print(f"  Usando {len(columnas_comunes)} columnas comunes")
                         
-                        df_final = pd.concat([df_final[columnas_compatibles], df_lote[columnas_compatibles]], 
-                                            ignore_index=True)
-                    
-                    print(f"  Lote {num_lote} combinado: {len(df_lote)} registros")
-                    
-                    # Liberar memoria explícitamente
-                    del resultados_lote
-                    del resultados_filtrados
-                    del df_lote
-                    import gc
-                    gc.collect()
-                    
-                except Exception as e:
-                    error_msg = f"Error al combinar lote {num_lote}: {str(e)}"
-                    self.advertencias.append(error_msg)
-                    print(f"  - {error_msg}")
+                        # Utilizar solo columnas comunes para concatenar
+                        resultados_filtrados = [df[columnas_comunes] for df in resultados_lote]
+                        df_lote = _concatenar_dataframes(resultados_filtrados)
+                        
+                        # Guardar el lote; concatenar aquí con el acumulado copiaría todo en cada lote
+                        lotes_combinados.append(df_lote)
+                        
+                        if self.mostrar_progreso:
+                            print(f"  Lote {num_lote} combinado: {len(df_lote)} registros")
+                        
+                        # Liberar memoria explícitamente
+                        del resultados_lote
+                        del resultados_filtrados
+                        del df_lote
+                        import gc
+                        gc.collect()
+                        
+                    except Exception as e:
+                        error_msg = f"Error al combinar lote {num_lote}: {str(e)}"
+                        self.advertencias.append(error_msg)
+                        print(f"  - {error_msg}")
+            
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        # Concatenar todos los lotes de una vez, con las columnas compatibles entre lotes
+        df_final = None
+        if lotes_combinados:
+            otras_columnas = [set(df.columns) for df in lotes_combinados[1:]]
+            columnas_compatibles = [
+                col for col in lotes_combinados[0].columns
+                if all(col in columnas for columnas in otras_columnas)
+            ]
+            df_final = _concatenar_dataframes([df[columnas_compatibles] for df in lotes_combinados])
+            del lotes_combinados
         
         # Verificar resultado final
         if df_final is not None and not df_final.empty:
@@ -494,7 +722,7 @@ class PaiProcessor:
             return pd.DataFrame()
     
     def consolidar_archivos(self, directorio: str, patron: str = "*.xls*", 
-                           excluir_patrones: List[str] = None,
+                           excluir_patrones: Union[List[str], Pattern, None] = None,
                            usar_paralelo: bool = True) -> pd.DataFrame:
         """
         Consolida todos los datos de archivos PAI en un directorio.
@@ -503,6 +731,7 @@ class PaiProcessor:
             directorio: Carpeta base donde están los registros.
             patron: Patrón para identificar archivos (default: "*.xls*").
             excluir_patrones: Lista de patrones a excluir (ej. ["COVID", "respaldo"])
+                o expresión regular compilada.
             usar_paralelo: Si True, usa procesamiento paralelo para mejorar rendimiento.
             
         Returns:
@@ -537,7 +766,8 @@ class PaiProcessor:
             
             # Procesar cada archivo secuencialmente
             for i, archivo in enumerate(archivos, 1):
-                print(f"\nProcesando archivo {i}/{len(archivos)}: {os.path.basename(archivo)}")
+                if self.mostrar_progreso:
+                    print(f"\nProcesando archivo {i}/{len(archivos)}: {os.path.basename(archivo)}")
                 try:
                     df = self.procesar_archivo(archivo)
                     if not df.empty:
@@ -558,7 +788,7 @@ class PaiProcessor:
             # Combinar todos los DataFrames
             if dfs:
                 print(f"\nCombinando {len(dfs)} archivos procesados...")
-                df_combinado = pd.concat(dfs, ignore_index=True)
+                df_combinado = _concatenar_dataframes(dfs)
                 print(f"Consolidación completada: {len(df_combinado)} registros totales")
             else:
                 print("No se pudo procesar ningún archivo correctamente.")
@@ -594,16 +824,16 @@ class PaiProcessor:
             print("No hay datos consolidados para filtrar. Ejecute consolidar_archivos primero.")
             return {}
         
-        df = self.datos_consolidados.copy()
-        
-        # Identificar columnas relacionadas con la vacuna
-        vacuna_lower = vacuna.lower()
-        columnas_vacuna = []
+        # Solo se lee: no hace falta copiar los datos consolidados
+        df = self.datos_consolidados
         
-        for col in df.columns:
-            col_str = str(col).lower()
-            if vacuna_lower in col_str:
-                columnas_vacuna.append(col)
+        # Identificar columnas relacionadas con la vacuna, buscando en todos los nombres a la vez;
+        # también se busca el nombre como queda en las columnas normalizadas ("Fiebre amarilla"
+        # -> "fiebre_amarilla")
+        nombres = pd.Index([_nombre_columna_minusculas(col) for col in df.columns])
+        terminos = {vacuna.lower(), limpiar_nombre_columna(vacuna).lower()}
+        coincide = np.logical_or.reduce([nombres.str.contains(t, regex=False) for t in terminos])
+        columnas_vacuna = df.columns[coincide].tolist()
         
         if not columnas_vacuna:
             print(f"No se encontraron columnas relacionadas con '{vacuna}' en los datos consolidados.")
@@ -616,123 +846,188 @@ class PaiProcessor:
             print(f"  ... y {len(columnas_vacuna) - 10} más")
         
         # Filtrar registros que tienen datos en alguna de estas columnas
-        tiene_datos = df[columnas_vacuna].notna().any(axis=1)
-        df_filtrado = df[tiene_datos].copy()
-        
-        # Intentar identificar columnas de dosis
-        columnas_dosis = []
+        # (máscara acumulada en su lugar columna a columna, sin armar un DataFrame ni una matriz
+        # booleana intermedia; take produce una copia independiente en una sola pasada)
+        tiene_datos = np.zeros(len(df), dtype=bool)
         for col in columnas_vacuna:
-            col_str = str(col).lower()
-            if "dosis" in col_str:
-                columnas_dosis.append(col)
+            np.logical_or(tiene_datos, df[col].notna().to_numpy(), out=tiene_datos)
+        df_filtrado = df.take(np.flatnonzero(tiene_datos))
+        
+        # Columnas de baja cardinalidad como categóricas para acelerar conteos y escritura
+        # (los datos cargados desde CSV o Excel llegan como texto; los consolidados ya lo son)
+        for col in COLUMNAS_CATEGORICAS:
+            if col in df_filtrado.columns and not isinstance(df_filtrado[col].dtype, pd.CategoricalDtype):
+                df_filtrado[col] = df_filtrado[col].astype("category")
+        
+        # Intentar identificar columnas de dosis (entre los nombres en minúsculas ya calculados)
+        nombres_vacuna = nombres[coincide]
+        columnas_dosis = [col for col, nombre in zip(columnas_vacuna, nombres_vacuna) if "dosis" in nombre]
         
         if columnas_dosis:
             col_dosis = columnas_dosis[0]
             print(f"Columna de dosis identificada: {col_dosis}")
             
-            # Marcar si está vacunado
-            df_filtrado["Vacunado"] = df_filtrado[col_dosis].notna() & (df_filtrado[col_dosis] != "fin")
-            df_filtrado["Tipo_Dosis"] = df_filtrado[col_dosis].apply(
-                lambda x: limpiar_texto(x) if pd.notna(x) and x != "fin" else None
-            )
+            # Una sola factorización de la columna de dosis: "fin" (marca de fin de registros),
+            # la limpieza del texto y los indicadores se resuelven sobre los valores distintos
+            # y se llevan a las filas por código
+            codigos_crudos, valores = pd.factorize(df_filtrado[col_dosis])
+            valores = np.asarray(valores, dtype=object)
+            es_valor_dosis = valores != "fin"
+            # Marcar si está vacunado (los nulos quedan con código -1)
+            es_dosis = codigos_crudos >= 0
+            es_dosis[es_dosis] = es_valor_dosis[codigos_crudos[es_dosis]]
+            df_filtrado["Vacunado"] = es_dosis
             
-            # Añadir contadores por tipo de dosis
-            df_filtrado["Es_Primera_Dosis"] = df_filtrado["Tipo_Dosis"].apply(
-                lambda x: 1 if x and "PRIMERA" in str(x).upper() else 0
-            )
-            df_filtrado["Es_Segunda_Dosis"] = df_filtrado["Tipo_Dosis"].apply(
-                lambda x: 1 if x and "SEGUNDA" in str(x).upper() else 0
-            )
-            df_filtrado["Es_Refuerzo"] = df_filtrado["Tipo_Dosis"].apply(
-                lambda x: 1 if x and "REFUERZO" in str(x).upper() else 0
-            )
-            df_filtrado["Es_Unica_Dosis"] = df_filtrado["Tipo_Dosis"].apply(
-                lambda x: 1 if x and "UNICA" in str(x).upper() else 0
-            )
+            # Pocos valores distintos: como categoría se guarda un código por fila
+            tipos = pd.Categorical(limpiar_texto_series(pd.Series(valores).where(es_valor_dosis)))
+            codigos = np.append(tipos.codes, -1)[np.where(es_dosis, codigos_crudos, -1)]
+            df_filtrado["Tipo_Dosis"] = pd.Categorical.from_codes(codigos, dtype=tipos.dtype)
+            
+            # Añadir contadores por tipo de dosis (Tipo_Dosis ya está en mayúsculas): el texto
+            # se revisa solo en las categorías, sin tildes ("ÚNICA" cuenta como UNICA); una
+            # tabla de indicadores por categoría (la última fila, en ceros, para los nulos)
+            # se lleva a las filas con una sola indexación, en uint8 (un byte por fila)
+            categorias = [quitar_tildes(categoria) for categoria in tipos.categories]
+            tabla = np.zeros((len(DOSIS_INDICADORAS), len(categorias) + 1), dtype=np.uint8)
+            for fila, termino in zip(tabla, DOSIS_INDICADORAS.values()):
+                fila[:-1] = [termino in categoria for categoria in categorias]
+            indicadores = tabla.take(codigos, axis=1)
+            for columna, indicador in zip(DOSIS_INDICADORAS, indicadores):
+                df_filtrado[columna] = indicador
         else:
             print("No se identificó columna específica de dosis")
-            # Usar cualquier dato en columnas de vacuna como indicador
-            df_filtrado["Vacunado"] = df_filtrado[columnas_vacuna].notna().any(axis=1)
+            # Usar cualquier dato en columnas de vacuna como indicador: por construcción
+            # del filtro anterior, todas las filas de df_filtrado tienen alguno
+            df_filtrado["Vacunado"] = np.ones(len(df_filtrado), dtype=bool)
             df_filtrado["Tipo_Dosis"] = None
-            df_filtrado["Es_Primera_Dosis"] = 0
-            df_filtrado["Es_Segunda_Dosis"] = 0
-            df_filtrado["Es_Refuerzo"] = 0
-            df_filtrado["Es_Unica_Dosis"] = 0
+            for columna in DOSIS_INDICADORAS:
+                df_filtrado[columna] = np.zeros(len(df_filtrado), dtype=np.uint8)
         
         # Preparar resultado según tipo de consolidado
         resultado = {}
         
         if tipo_consolidado == "vacunacion" or tipo_consolidado == "ambos":
             # Consolidado por lugar de vacunación
-            df_vacunacion = df_filtrado.copy()
-            # Ordenar columnas para priorizar datos de vacunación
+            # Ordenar columnas para priorizar datos de vacunación (la selección ya crea un DataFrame nuevo)
             cols_vacunacion = ["Municipio_Vacunacion", "Año_Registro", "Mes_Registro"]
-            cols_resto = [col for col in df_vacunacion.columns if col not in cols_vacunacion]
-            df_vacunacion = df_vacunacion[cols_vacunacion + cols_resto]
+            prioritarias = set(cols_vacunacion)
+            cols_resto = [col for col in df_filtrado.columns if col not in prioritarias]
+            df_vacunacion = df_filtrado[cols_vacunacion + cols_resto]
             resultado["vacunacion"] = df_vacunacion
             
         if tipo_consolidado == "residencia" or tipo_consolidado == "ambos":
             # Consolidado por lugar de residencia
-            df_residencia = df_filtrado.copy()
-            # Ordenar columnas para priorizar datos de residencia
-            cols_residencia = [col for col in df_residencia.columns 
-                            if "Residencia" in col or "Departamento_" in col or "Municipio_" in col]
-            cols_resto = [col for col in df_residencia.columns if col not in cols_residencia]
-            df_residencia = df_residencia[cols_residencia + cols_resto]
+            # Ordenar columnas para priorizar datos de residencia (la selección ya crea un DataFrame nuevo)
+            # (una sola pasada que reparte cada columna en su grupo)
+            cols_residencia, cols_resto = [], []
+            for col in df_filtrado.columns:
+                nombre = str(col)
+                if "Residencia" in nombre or "Departamento_" in nombre or "Municipio_" in nombre:
+                    cols_residencia.append(col)
+                else:
+                    cols_resto.append(col)
+            df_residencia = df_filtrado[cols_residencia + cols_resto]
             resultado["residencia"] = df_residencia
         
         return resultado
     
-    def generar_estadisticas(self, df: pd.DataFrame, tipo: str = "vacunacion") -> Dict[str, Any]:
+    def generar_estadisticas_comunes(self, df: pd.DataFrame) -> Dict[str, Any]:
         """
-        Genera estadísticas para los datos filtrados.
+        Calcula las estadísticas que no dependen del tipo de consolidado.
         
         Args:
             df: DataFrame con datos filtrados.
-            tipo: Tipo de consolidado ("residencia" o "vacunacion").
             
         Returns:
-            Diccionario con estadísticas.
+            Diccionario con totales, distribución temporal, grupo etario y dosis.
         """
-        if df.empty:
-            return {
-                "total_registros": 0,
-                "mensaje": "No hay datos para generar estadísticas"
-            }
-        
-        estadisticas = {
+        comunes = {
             "total_registros": len(df),
             "registros_por_año": {},
             "registros_por_mes": {},
-            "distribucion_grupo_etario": {},
-            "tipo_consolidado": tipo
+            "distribucion_grupo_etario": {}
         }
         
         # Estadísticas por año
         if "Año_Registro" in df.columns:
-            for año, grupo in df.groupby("Año_Registro"):
-                if pd.notna(año):
-                    estadisticas["registros_por_año"][año] = len(grupo)
+            comunes["registros_por_año"] = _contar_valores(df["Año_Registro"], ordenar_claves=True)
         
         # Estadísticas por mes
         if "Mes_Registro" in df.columns:
-            for mes, grupo in df.groupby("Mes_Registro"):
-                if pd.notna(mes):
-                    estadisticas["registros_por_mes"][mes] = len(grupo)
+            comunes["registros_por_mes"] = _contar_valores(df["Mes_Registro"], ordenar_claves=True)
         
         # Estadísticas por grupo etario
         if "Grupo_Etario" in df.columns:
-            for grupo, conteo in df["Grupo_Etario"].value_counts().items():
-                estadisticas["distribucion_grupo_etario"][grupo] = int(conteo)
+            comunes["distribucion_grupo_etario"] = _contar_valores(df["Grupo_Etario"])
+        
+        # Estadísticas de vacunación
+        if "Vacunado" in df.columns:
+            # Desglose por tipo de dosis
+            dosis_cols = {
+                "Es_Primera_Dosis": "Primera dosis",
+                "Es_Segunda_Dosis": "Segunda dosis",
+                "Es_Refuerzo": "Refuerzo",
+                "Es_Unica_Dosis": "Dosis única"
+            }
+            
+            # Vacunado (bool) y los indicadores (uint8, 0/1) se cuentan directamente sobre
+            # cada arreglo, sin armar un DataFrame con las columnas ni pasar por pandas
+            presentes = [col for col in dosis_cols if col in df.columns]
+            totales = {col: int(np.count_nonzero(df[col].to_numpy())) for col in ["Vacunado"] + presentes}
+            
+            total_vacunados = totales["Vacunado"]
+            comunes["total_vacunados"] = total_vacunados
+            
+            comunes["tipos_dosis"] = {}
+            for col in presentes:
+                nombre = dosis_cols[col]
+                total = totales[col]
+                if total > 0:
+                    porcentaje = total/total_vacunados*100 if total_vacunados > 0 else 0
+                    comunes["tipos_dosis"][nombre] = {
+                        "total": total,
+                        "porcentaje": round(porcentaje, 1)
+                    }
+        
+        return comunes
+    
+    def generar_estadisticas(self, df: pd.DataFrame, tipo: str = "vacunacion",
+                             comunes: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Genera estadísticas para los datos filtrados.
+        
+        Args:
+            df: DataFrame con datos filtrados.
+            tipo: Tipo de consolidado ("residencia" o "vacunacion").
+            comunes: Estadísticas ya calculadas con generar_estadisticas_comunes
+                sobre las mismas filas; si se indican no se recalculan.
+            
+        Returns:
+            Diccionario con estadísticas.
+        """
+        if df.empty:
+            return {
+                "total_registros": 0,
+                "mensaje": "No hay datos para generar estadísticas"
+            }
+        
+        if comunes is None:
+            comunes = self.generar_estadisticas_comunes(df)
+        
+        estadisticas = {
+            "total_registros": comunes["total_registros"],
+            "registros_por_año": comunes["registros_por_año"],
+            "registros_por_mes": comunes["registros_por_mes"],
+            "distribucion_grupo_etario": comunes["distribucion_grupo_etario"],
+            "tipo_consolidado": tipo
+        }
         
         # Estadísticas específicas según tipo de consolidado
         if tipo == "vacunacion":
             # Estadísticas por municipio de vacunación
             estadisticas["municipios_vacunacion"] = {}
             if "Municipio_Vacunacion" in df.columns:
-                for muni, conteo in df["Municipio_Vacunacion"].value_counts().items():
-                    if pd.notna(muni):
-                        estadisticas["municipios_vacunacion"][muni] = int(conteo)
+                estadisticas["municipios_vacunacion"] = _contar_valores(df["Municipio_Vacunacion"])
                 estadisticas["total_municipios"] = len(estadisticas["municipios_vacunacion"])
         
         elif tipo == "residencia":
@@ -741,39 +1036,15 @@ class PaiProcessor:
             estadisticas["municipios_residencia"] = {}
             
             if "Departamento_Residencia" in df.columns:
-                for depto, conteo in df["Departamento_Residencia"].value_counts().items():
-                    if pd.notna(depto):
-                        estadisticas["departamentos_residencia"][depto] = int(conteo)
+                estadisticas["departamentos_residencia"] = _contar_valores(df["Departamento_Residencia"])
                 estadisticas["total_departamentos"] = len(estadisticas["departamentos_residencia"])
             
             if "Municipio_Residencia" in df.columns:
-                for muni, conteo in df["Municipio_Residencia"].value_counts().items():
-                    if pd.notna(muni):
-                        estadisticas["municipios_residencia"][muni] = int(conteo)
+                estadisticas["municipios_residencia"] = _contar_valores(df["Municipio_Residencia"])
                 estadisticas["total_municipios_residencia"] = len(estadisticas["municipios_residencia"])
         
-        # Estadísticas de vacunación
-        if "Vacunado" in df.columns:
-            total_vacunados = df["Vacunado"].sum()
-            estadisticas["total_vacunados"] = int(total_vacunados)
-            
-            # Desglose por tipo de dosis
-            dosis_cols = {
-                "Es_Primera_Dosis": "Primera dosis",
-                "Es_Segunda_Dosis": "Segunda dosis",
-                "Es_Refuerzo": "Refuerzo",
-                "Es_Unica_Dosis": "Dosis única"
-            }
-            
-            estadisticas["tipos_dosis"] = {}
-            for col, nombre in dosis_cols.items():
-                if col in df.columns:
-                    total = df[col].sum()
-                    if total > 0:
-                        porcentaje = total/total_vacunados*100 if total_vacunados > 0 else 0
-                        estadisticas["tipos_dosis"][nombre] = {
-                            "total": int(total),
-                            "porcentaje": round(porcentaje, 1)
-                        }
-        
-        return estadisticas
\ No newline at end of file
+        if "total_vacunados" in comunes:
+            estadisticas["total_vacunados"] = comunes["total_vacunados"]
+            estadisticas["tipos_dosis"] = comunes["tipos_dosis"]
+        
+        return estadisticas
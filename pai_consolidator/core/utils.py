@@ -4,13 +4,175 @@ Funciones de utilidad para el procesamiento de archivos PAI.
 import os
 import re
 import glob
-from typing import List, Dict, Any, Optional, Union, Tuple
+import functools
+import hashlib
+import pickle
+import unicodedata
+import importlib.util
+from typing import List, Dict, Any, Optional, Union, Tuple, Pattern
 import pandas as pd
 import numpy as np
+from pandas.io.parsers import TextParser
 from datetime import datetime
 
+from .. import __version__
+
+# Expresiones regulares compiladas una sola vez (se usan por cada archivo y columna)
+PATRON_AÑO = re.compile(r'(20\d{2})')
+PATRON_MUNICIPIO_ARCHIVO = re.compile(r'^([A-Za-z]+)[_\s]')
+PATRON_ESPACIOS = re.compile(r'\s+')
+PATRON_NO_ALFANUMERICO = re.compile(r'\W+')
+PATRON_GUIONES = re.compile(r'_+')
+
+# python-calamine (opcional) lee xlsx/xls mucho más rápido que openpyxl/xlrd
+CALAMINE_DISPONIBLE = importlib.util.find_spec("python_calamine") is not None
+
+# pyarrow (opcional) guarda las columnas de texto en buffers contiguos en vez de objetos de Python
+PYARROW_DISPONIBLE = importlib.util.find_spec("pyarrow") is not None
+
+def _motor_clasico(ruta_archivo: str) -> str:
+    """
+    Motor de lectura tradicional según la extensión del archivo.
+    
+    Args:
+        ruta_archivo: Ruta al archivo Excel.
+        
+    Returns:
+        'openpyxl' para xlsx/xlsm, 'xlrd' para el resto.
+    """
+    ext = os.path.splitext(ruta_archivo)[1].lower()
+    return 'openpyxl' if ext in ['.xlsx', '.xlsm'] else 'xlrd'
+
+def obtener_motor_excel(ruta_archivo: str, motor: Optional[str] = None) -> str:
+    """
+    Determina el motor de pandas para leer un archivo Excel, usando calamine si está instalado.
+    
+    Args:
+        ruta_archivo: Ruta al archivo Excel.
+        motor: Motor elegido explícitamente (None = automático según la extensión).
+        
+    Returns:
+        Nombre del motor para pd.read_excel / pd.ExcelFile.
+    """
+    if motor:
+        return motor
+    
+    ext = os.path.splitext(ruta_archivo)[1].lower()
+    if CALAMINE_DISPONIBLE and ext in ['.xlsx', '.xlsm', '.xlsb', '.xls']:
+        return 'calamine'
+    return _motor_clasico(ruta_archivo)
+
+def _leer_excel(ruta_archivo: str, engine: str, **kwargs) -> pd.DataFrame:
+    """
+    Lee un archivo Excel con el motor indicado; si calamine falla, reintenta con el motor tradicional.
+    
+    Args:
+        ruta_archivo: Ruta al archivo Excel.
+        engine: Motor de lectura a usar.
+        **kwargs: Argumentos adicionales para pd.read_excel.
+        
+    Returns:
+        DataFrame leído.
+    """
+    try:
+        return pd.read_excel(ruta_archivo, engine=engine, **kwargs)
+    except Exception:
+        if engine != 'calamine':
+            raise
+        return pd.read_excel(ruta_archivo, engine=_motor_clasico(ruta_archivo), **kwargs)
+
+def leer_hoja_cruda(ruta_archivo: str, hoja: Any, engine: str,
+                    libro: Optional[pd.ExcelFile] = None) -> pd.DataFrame:
+    """
+    Lee la cuadrícula de celdas de una hoja, sin interpretar encabezados.
+    
+    analizar_estructura_excel la lee una sola vez y la entrega en la estructura
+    (clave "cuadricula") para que leer_excel_con_estructura arme el DataFrame sin
+    volver a abrir y parsear el libro.
+    
+    Args:
+        ruta_archivo: Ruta al archivo Excel.
+        hoja: Nombre o índice de la hoja.
+        engine: Motor de lectura a usar.
+        libro: Libro ya abierto del mismo archivo (opcional): se lee desde él sin reabrirlo.
+        
+    Returns:
+        DataFrame de tipo object con una columna por columna de la hoja.
+    """
+    if libro is not None:
+        try:
+            return libro.parse(hoja, header=None, dtype=object)
+        except Exception:
+            # Se reintenta abriendo el archivo (con el motor tradicional si calamine falla)
+            pass
+    return _leer_excel(ruta_archivo, engine, sheet_name=hoja, header=None, dtype=object)
+
+def _rellenar_encabezado_superior(fila: List[Any], control: List[bool]) -> Tuple[List[Any], List[bool]]:
+    """
+    Propaga hacia la derecha los valores de una fila de encabezado (celdas combinadas),
+    igual que pandas.read_excel con una lista de filas de encabezado: la fila de control
+    evita que una celda vacía tome el valor de la izquierda si la fila anterior ya
+    separó esas columnas.
+    """
+    ultimo = fila[0]
+    for i in range(1, len(fila)):
+        if not control[i]:
+            ultimo = fila[i]
+        if fila[i] == "" or fila[i] is None:
+            fila[i] = ultimo
+        else:
+            control[i] = False
+            ultimo = fila[i]
+    return fila, control
+
+def construir_desde_cuadricula(crudo: pd.DataFrame, header: Union[int, List[int], None],
+                               num_columnas: Optional[int] = None) -> pd.DataFrame:
+    """
+    Construye el DataFrame que devolvería pd.read_excel con el encabezado indicado
+    a partir de la cuadrícula cruda, sin volver a leer el archivo.
+    
+    Args:
+        crudo: Cuadrícula devuelta por leer_hoja_cruda.
+        header: Fila o filas de encabezado (como en pd.read_excel).
+        num_columnas: Número de columnas a conservar (None = todas).
+        
+    Returns:
+        DataFrame con encabezados y tipos inferidos como en pd.read_excel.
+    """
+    if num_columnas is not None:
+        crudo = crudo.iloc[:, :num_columnas]
+    
+    # Las celdas vacías llegan a pandas como "" desde el lector de Excel
+    filas = crudo.where(crudo.notna(), "").values.tolist()
+    if not filas:
+        return pd.DataFrame()
+    
+    if isinstance(header, list) and len(header) > 1:
+        # pandas rellena todas las filas de encabezado de la lista, también la última
+        # (una lista de una sola fila se trata como un entero, sin relleno)
+        control = [True] * len(filas[0])
+        for fila in header:
+            filas[fila], control = _rellenar_encabezado_superior(list(filas[fila]), control)
+    
+    return TextParser(filas, header=header).read()
+
+def compilar_patrones_exclusion(patrones: List[str]) -> Optional[Pattern]:
+    """
+    Compila una lista de patrones de exclusión en una única expresión regular.
+    
+    Args:
+        patrones: Lista de textos a excluir (ej. ["COVID", "respaldo"]).
+        
+    Returns:
+        Expresión regular compilada (sin distinguir mayúsculas) o None si no hay patrones.
+    """
+    partes = [re.escape(p.strip()) for p in patrones if p and p.strip()]
+    if not partes:
+        return None
+    return re.compile("|".join(partes), re.IGNORECASE)
+
 def listar_archivos_pai(directorio_base: str, patron: str = "*.xls*", 
-                        excluir_patrones: List[str] = None) -> List[str]:
+                        excluir_patrones: Union[List[str], Pattern, None] = None) -> List[str]:
     """
     Lista todos los archivos PAI en estructura de directorios por año y municipio.
     
@@ -18,6 +180,7 @@ def listar_archivos_pai(directorio_base: str, patron: str = "*.xls*",
         directorio_base: Directorio base donde buscar.
         patron: Patrón de archivos a incluir (*.xlsx, *.xlsm, etc.)
         excluir_patrones: Lista de patrones a excluir (ej. ["COVID", "respaldo"])
+            o expresión regular ya compilada con compilar_patrones_exclusion.
         
     Returns:
         Lista de rutas a archivos PAI encontrados.
@@ -29,15 +192,24 @@ def listar_archivos_pai(directorio_base: str, patron: str = "*.xls*",
     if excluir_patrones is None:
         excluir_patrones = ["COVID", "covid"]
     
+    # Una sola expresión regular evalúa todos los patrones en una pasada por ruta
+    if isinstance(excluir_patrones, re.Pattern):
+        excluir_regex = excluir_patrones
+    else:
+        excluir_regex = compilar_patrones_exclusion(excluir_patrones)
+    
+    def excluido(ruta: str) -> bool:
+        return excluir_regex is not None and excluir_regex.search(ruta) is not None
+    
     archivos_encontrados = []
     
     # Rutas a explorar: primero el propio directorio_base
     rutas_a_explorar = [directorio_base]
     
-    # Añadir subdirectorios directos para búsqueda
+    # Añadir subdirectorios directos para búsqueda (descartando los excluidos antes de recorrerlos)
     for item in os.listdir(directorio_base):
         ruta_item = os.path.join(directorio_base, item)
-        if os.path.isdir(ruta_item):
+        if os.path.isdir(ruta_item) and not excluido(ruta_item):
             rutas_a_explorar.append(ruta_item)
     
     # Buscar estructura de año (REGISTROS_XXXX) y municipios
@@ -47,21 +219,74 @@ def listar_archivos_pai(directorio_base: str, patron: str = "*.xls*",
             # Buscar carpetas de municipios dentro
             for municipio in os.listdir(ruta):
                 ruta_municipio = os.path.join(ruta, municipio)
-                if os.path.isdir(ruta_municipio):
+                if os.path.isdir(ruta_municipio) and not excluido(ruta_municipio):
                     # Buscar archivos Excel dentro de la carpeta del municipio
-                    for archivo in glob.glob(os.path.join(ruta_municipio, patron)):
+                    # (iglob entrega las rutas a medida que lee la carpeta, sin lista intermedia)
+                    for archivo in glob.iglob(os.path.join(ruta_municipio, patron)):
                         # Verificar si el archivo coincide con algún patrón de exclusión
-                        if not any(excluir in archivo for excluir in excluir_patrones):
+                        if not excluido(archivo):
                             archivos_encontrados.append(archivo)
         
         # Buscar directamente en la ruta actual (podría ser una carpeta de municipio)
-        for archivo in glob.glob(os.path.join(ruta, patron)):
+        for archivo in glob.iglob(os.path.join(ruta, patron)):
             # Verificar si el archivo coincide con algún patrón de exclusión
-            if not any(excluir in archivo for excluir in excluir_patrones):
+            if not excluido(archivo):
                 archivos_encontrados.append(archivo)
     
     return archivos_encontrados
 
+def _año_de_componente(comp: str) -> Optional[str]:
+    """
+    Año representado por un componente de ruta ("REGISTROS_XXXX" o "20XX"), si lo hay.
+    """
+    if comp.startswith("REGISTROS_") and len(comp) >= 11:
+        año_str = comp[-4:]
+        if año_str.isdigit() and 2000 <= int(año_str) <= 2100:
+            return año_str
+    elif comp.isdigit() and len(comp) == 4 and 2000 <= int(comp) <= 2100:
+        return comp
+    return None
+
+@functools.lru_cache(maxsize=1024)
+def _info_directorio(directorio: str) -> Dict[str, Optional[str]]:
+    """
+    Año y municipio que se deducen de las carpetas de una ruta.
+    Todos los archivos de una carpeta comparten el resultado, así que se calcula
+    una sola vez por directorio. El diccionario es compartido: no se debe modificar.
+    
+    Args:
+        directorio: Directorio que contiene el archivo.
+        
+    Returns:
+        Diccionario con 'año' y 'municipio' (None si no se encontraron).
+    """
+    componentes = os.path.normpath(directorio).split(os.sep) if directorio else []
+    
+    # El último componente con año es el que cuenta
+    año = None
+    for comp in componentes:
+        año = _año_de_componente(comp) or año
+    
+    # Buscar el componente que parece ser un municipio
+    # Típicamente sería la carpeta después de "REGISTROS_XXXX"
+    municipio = None
+    for i, comp in enumerate(componentes):
+        if comp.startswith("REGISTROS_") and i + 1 < len(componentes):
+            municipio = componentes[i + 1].upper()
+            break
+    
+    # Si no se encontró con el patrón anterior, buscar un componente que no sea "REGISTROS_" y no parezca año
+    if municipio is None:
+        for comp in componentes:
+            if (not comp.startswith("REGISTROS_") and 
+                not comp.isdigit() and 
+                comp.upper() == comp and  # Está en mayúsculas
+                len(comp) > 2):  # No es muy corto
+                municipio = comp.upper()
+                break
+    
+    return {"año": año, "municipio": municipio}
+
 def extraer_fecha_de_archivo(ruta_archivo: str) -> Dict[str, str]:
     """
     Extrae información de año y mes del nombre de archivo o ruta.
@@ -77,24 +302,20 @@ def extraer_fecha_de_archivo(ruta_archivo: str) -> Dict[str, str]:
         "mes": None
     }
     
-    # Intentar extraer año de la ruta
-    componentes = os.path.normpath(ruta_archivo).split(os.sep)
-    for comp in componentes:
-        # Buscar "REGISTROS_XXXX" o "20XX"
-        if comp.startswith("REGISTROS_") and len(comp) >= 11:
-            año_str = comp[-4:]
-            if año_str.isdigit() and 2000 <= int(año_str) <= 2100:
-                resultado["año"] = año_str
-        elif comp.isdigit() and len(comp) == 4 and 2000 <= int(comp) <= 2100:
-            resultado["año"] = comp
+    # Intentar extraer año de la ruta (las carpetas se analizan una vez por directorio)
+    directorio, nombre = os.path.split(os.path.normpath(ruta_archivo))
+    resultado["año"] = _info_directorio(directorio)["año"]
+    año_nombre = _año_de_componente(nombre)
+    if año_nombre:
+        resultado["año"] = año_nombre
     
     # Extraer nombre del archivo
-    nombre_archivo = os.path.basename(ruta_archivo).upper()
+    nombre_archivo = nombre.upper()
     
     # Intentar extraer año del nombre si no se encontró en la ruta
     if not resultado["año"]:
         # Buscar patrón "20XX" en el nombre
-        match_año = re.search(r'(20\d{2})', nombre_archivo)
+        match_año = PATRON_AÑO.search(nombre_archivo)
         if match_año:
             resultado["año"] = match_año.group(1)
     
@@ -123,40 +344,31 @@ def extraer_municipio_de_ruta(ruta_archivo: str) -> str:
     Returns:
         Nombre del municipio.
     """
-    # Dividir la ruta en componentes
-    componentes = os.path.normpath(ruta_archivo).split(os.sep)
-    
-    # Buscar el componente que parece ser un municipio
-    # Típicamente sería la carpeta después de "REGISTROS_XXXX"
-    for i, comp in enumerate(componentes[:-1]):  # Excluir el nombre del archivo
-        if comp.startswith("REGISTROS_") and i + 1 < len(componentes) - 1:
-            return componentes[i + 1].upper()
-    
-    # Si no se encontró con el patrón anterior, buscar un componente que no sea "REGISTROS_" y no parezca año
-    for comp in componentes[:-1]:  # Excluir el nombre del archivo
-        if (not comp.startswith("REGISTROS_") and 
-            not comp.isdigit() and 
-            comp.upper() == comp and  # Está en mayúsculas
-            len(comp) > 2):  # No es muy corto
-            return comp.upper()
+    # Buscar en las carpetas de la ruta (calculado una vez por directorio)
+    directorio = os.path.dirname(os.path.normpath(ruta_archivo))
+    municipio = _info_directorio(directorio)["municipio"]
+    if municipio:
+        return municipio
     
     # Si no se puede determinar, extraer del nombre del archivo
     nombre_archivo = os.path.basename(ruta_archivo)
     # Buscar primeras letras hasta un separador
-    match = re.match(r'^([A-Za-z]+)[_\s]', nombre_archivo)
+    match = PATRON_MUNICIPIO_ARCHIVO.match(nombre_archivo)
     if match:
         return match.group(1).upper()
     
     # En último caso, devolver "DESCONOCIDO"
     return "DESCONOCIDO"
 
-def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True) -> Dict[str, Any]:
+def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True,
+                              motor: Optional[str] = None) -> Dict[str, Any]:
     """
     Analiza la estructura de un archivo Excel PAI para determinar encabezados.
     
     Args:
         ruta_archivo: Ruta al archivo Excel.
         forzar_jerarquico: Si True, fuerza la detección de estructura jerárquica.
+        motor: Motor de lectura a usar (None = automático, ver obtener_motor_excel).
         
     Returns:
         Diccionario con información de la estructura.
@@ -167,17 +379,27 @@ def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True)
         "filas_encabezado": [0, 1],  # Por defecto usar las dos primeras filas
         "categorias_detectadas": {},
         "modo_jerarquico": forzar_jerarquico,  # Forzamos modo jerárquico si se solicita
+        "num_columnas": None,  # Columnas hasta la última con encabezado
+        "motor": None,  # Motor con el que se pudo abrir el archivo
+        "cuadricula": None,  # Celdas de la hoja seleccionada (la consume leer_excel_con_estructura)
         "error": None
     }
     
     try:
-        # Determinar extensión para usar el engine correcto
-        ext = os.path.splitext(ruta_archivo)[1].lower()
-        engine = 'openpyxl' if ext in ['.xlsx', '.xlsm'] else 'xlrd'
+        # Determinar el engine según la extensión (calamine si está disponible)
+        engine = obtener_motor_excel(ruta_archivo, motor)
         
-        # Leer información del archivo
+        # Leer información del archivo (el libro abierto se reutiliza para leer la hoja)
+        excel_file = None
         try:
-            excel_file = pd.ExcelFile(ruta_archivo, engine=engine)
+            try:
+                excel_file = pd.ExcelFile(ruta_archivo, engine=engine)
+            except Exception:
+                if engine != 'calamine':
+                    raise
+                engine = _motor_clasico(ruta_archivo)
+                excel_file = pd.ExcelFile(ruta_archivo, engine=engine)
+            estructura["motor"] = engine
             estructura["hojas"] = excel_file.sheet_names
             
             # Buscar específicamente la hoja "Registro Diario"
@@ -197,25 +419,31 @@ def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True)
                     
             estructura["hoja_seleccionada"] = hoja_objetivo
         except Exception as e:
+            if excel_file is not None:
+                excel_file.close()
             estructura["error"] = f"Error al leer hojas: {str(e)}"
             return estructura
         
         if not hoja_objetivo:
+            excel_file.close()
             estructura["error"] = "No se encontraron hojas en el archivo"
             return estructura
         
-        # Leer las primeras filas para análisis
+        # Leer la hoja una sola vez, desde el libro ya abierto: las primeras filas sirven
+        # para el análisis y la cuadrícula completa se entrega a leer_excel_con_estructura
         try:
-            df_encabezados = pd.read_excel(
-                ruta_archivo,
-                sheet_name=hoja_objetivo,
-                engine=engine,
-                header=None,
-                nrows=5  # Leer primeras 5 filas para análisis
-            )
+            estructura["cuadricula"] = leer_hoja_cruda(ruta_archivo, hoja_objetivo, engine, excel_file)
+            df_encabezados = estructura["cuadricula"].iloc[:5]
         except Exception as e:
             estructura["error"] = f"Error al leer encabezados: {str(e)}"
             return estructura
+        finally:
+            excel_file.close()
+        
+        # Última columna con encabezado: las columnas vacías del final (solo formato) no se leen
+        con_encabezado = np.flatnonzero(df_encabezados.iloc[:2].notna().any(axis=0).to_numpy())
+        if len(con_encabezado):
+            estructura["num_columnas"] = int(con_encabezado[-1]) + 1
         
         # Si se fuerza el modo jerárquico, no realizamos detección automática
         if not forzar_jerarquico:
@@ -235,10 +463,16 @@ def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True)
         categorias = {}
         ultimo_valor = None
         
+        # Las dos filas de encabezado como arreglos de NumPy: el acceso por posición
+        # es directo, sin pasar por .iloc en cada celda
+        fila_categorias = df_encabezados.iloc[0].to_numpy(dtype=object)
+        fila_subcategorias = (
+            df_encabezados.iloc[1].to_numpy(dtype=object) if len(df_encabezados) > 1
+            else np.full(len(fila_categorias), None, dtype=object)
+        )
+        
         # Iterar por la primera fila para detectar categorías
-        for i in range(len(df_encabezados.columns)):
-            valor = df_encabezados.iloc[0, i]
-            
+        for i, valor in enumerate(fila_categorias):
             # Si hay un valor (no es NaN), es una nueva categoría
             if pd.notna(valor) and str(valor).strip():
                 ultimo_valor = str(valor).strip()
@@ -246,10 +480,10 @@ def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True)
                     categorias[ultimo_valor] = []
             
             # Si hay un último valor y hay un valor en la segunda fila, añadir subcategoría
-            if ultimo_valor is not None and i < len(df_encabezados.columns):
+            if ultimo_valor is not None:
                 subcategoria = None
-                if pd.notna(df_encabezados.iloc[1, i]):
-                    subcategoria = str(df_encabezados.iloc[1, i]).strip()
+                if pd.notna(fila_subcategorias[i]):
+                    subcategoria = str(fila_subcategorias[i]).strip()
                 else:
                     # Si no hay subcategoría, usar una genérica basada en el índice
                     subcategoria = f"Columna_{i+1}"
@@ -266,62 +500,60 @@ def analizar_estructura_excel(ruta_archivo: str, forzar_jerarquico: bool = True)
         estructura["error"] = f"Error general: {str(e)}"
         return estructura
 
-def leer_excel_con_estructura(ruta_archivo: str, estructura: Dict[str, Any] = None) -> Tuple[pd.DataFrame, bool]:
+def leer_excel_con_estructura(ruta_archivo: str, estructura: Dict[str, Any] = None,
+                              motor: Optional[str] = None) -> Tuple[pd.DataFrame, bool]:
     """
     Lee un archivo Excel utilizando la información de estructura para manejar encabezados.
     
     Args:
         ruta_archivo: Ruta al archivo Excel.
         estructura: Información de estructura del archivo (opcional).
+        motor: Motor de lectura a usar (None = el que usó el análisis de estructura).
         
     Returns:
         Tuple con (DataFrame leído, es_jerarquico)
     """
     if estructura is None:
-        estructura = analizar_estructura_excel(ruta_archivo, forzar_jerarquico=True)
+        estructura = analizar_estructura_excel(ruta_archivo, forzar_jerarquico=True, motor=motor)
     
-    # Determinar extensión para usar el engine correcto
-    ext = os.path.splitext(ruta_archivo)[1].lower()
-    engine = 'openpyxl' if ext in ['.xlsx', '.xlsm'] else 'xlrd'
+    # Reutilizar el motor con el que se abrió el archivo al analizarlo
+    engine = motor or estructura.get("motor") or obtener_motor_excel(ruta_archivo)
     
     hoja = estructura["hoja_seleccionada"]
     if not hoja and estructura["hojas"]:
         hoja = estructura["hojas"][0]
     
+    # Limitar el DataFrame a las columnas con encabezado
+    num_columnas = estructura.get("num_columnas")
+    
+    # La cuadrícula leída en el análisis se saca de la estructura: así se libera en cuanto
+    # se arma el DataFrame, en vez de seguir en memoria mientras viva la estructura
+    crudo = estructura.pop("cuadricula", None)
+    if crudo is None:
+        crudo = leer_hoja_cruda(ruta_archivo, hoja, engine)
+    
     # Intentar leer con encabezados jerárquicos si se detectó o forzó
     if estructura["modo_jerarquico"]:
         try:
-            df = pd.read_excel(
-                ruta_archivo,
-                sheet_name=hoja,
-                engine=engine,
-                header=[0, 1]  # Siempre usar las dos primeras filas en modo jerárquico
-            )
+            # Siempre usar las dos primeras filas en modo jerárquico; la hoja ya está
+            # en memoria desde el análisis de estructura
+            df = construir_desde_cuadricula(crudo, [0, 1], num_columnas)
             return df, True
         except Exception as e:
             print(f"  - Error al leer con encabezados jerárquicos: {str(e)}")
             print("  - Intentando método alternativo...")
             pass
     
-    # Método tradicional (encabezado en una sola fila)
+    # Método tradicional (encabezado en una sola fila); los intentos alternativos se
+    # arman sobre la misma cuadrícula en memoria, sin volver a leer el archivo
     try:
         fila_encabezado = estructura["filas_encabezado"][0] if estructura["filas_encabezado"] else 1
-        df = pd.read_excel(
-            ruta_archivo,
-            sheet_name=hoja,
-            engine=engine,
-            header=fila_encabezado
-        )
+        df = construir_desde_cuadricula(crudo, fila_encabezado, num_columnas)
         return df, False
     except Exception as e:
-        # Último intento: leer sin encabezados
+        # Último intento: sin encabezados
         try:
-            df = pd.read_excel(
-                ruta_archivo,
-                sheet_name=hoja,
-                engine=engine,
-                header=None
-            )
+            df = construir_desde_cuadricula(crudo, None)
             return df, False
         except Exception:
             # Si todos los intentos fallan, lanzar la excepción original
@@ -341,11 +573,113 @@ def limpiar_texto(texto: str) -> str:
         return str(texto)
     
     # Eliminar espacios adicionales
-    texto = re.sub(r'\s+', ' ', texto).strip()
+    texto = PATRON_ESPACIOS.sub(' ', texto).strip()
     
     # Convertir a mayúsculas
     return texto.upper()
 
+def quitar_tildes(texto: str) -> str:
+    """
+    Elimina tildes y diacríticos de un texto (ÚNICA -> UNICA).
+    
+    Args:
+        texto: Texto a normalizar.
+        
+    Returns:
+        Texto sin tildes.
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+def limpiar_texto_series(serie: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de limpiar_texto para una columna completa.
+    
+    Args:
+        serie: Serie con los textos a limpiar.
+        
+    Returns:
+        Serie de tipo object con los textos limpios y None en los valores nulos.
+    """
+    if serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype):
+        # Municipios y departamentos se repiten mucho: se limpia cada valor distinto una sola vez.
+        # factorize ya deja los nulos fuera (código -1), así que no hace falta separarlos antes
+        codigos, unicos = pd.factorize(serie)
+        unicos = pd.Series(unicos, dtype=object)
+        try:
+            limpios = unicos.str.replace(r'\s+', ' ', regex=True).str.strip().str.upper()
+        except AttributeError:
+            # Columna sin ningún texto
+            limpios = pd.Series(np.nan, index=unicos.index, dtype=object)
+        # Los métodos .str devuelven NaN para lo que no es texto: se convierte con str() como en limpiar_texto
+        no_texto = limpios.isna()
+        if no_texto.any():
+            limpios[no_texto] = unicos[no_texto].astype(str)
+        # El None agregado al final es el que toman los nulos con su código -1
+        limpios = np.append(limpios.to_numpy(dtype=object), None)
+        return pd.Series(limpios[codigos], index=serie.index, dtype=object)
+    
+    resultado = pd.Series(np.full(len(serie), None, dtype=object), index=serie.index)
+    mascara = serie.notna()
+    resultado[mascara] = serie[mascara].astype(str)
+    return resultado
+
+# Mayor número que, escrito como texto en una celda de fecha, se interpreta como año
+LIMITE_ANIO_TEXTO = 9999
+
+def _fechas_desde_serial(valores: pd.Series) -> pd.Series:
+    """
+    Convierte números de serie de Excel (días desde 1899-12-30) a fechas.
+    
+    Args:
+        valores: Serie numérica.
+        
+    Returns:
+        Serie datetime64 (NaT para valores fuera de rango).
+    """
+    return pd.to_datetime(valores.astype(float), unit="D", origin="1899-12-30", errors="coerce")
+
+def convertir_fechas(serie: pd.Series) -> pd.Series:
+    """
+    Convierte una columna de fechas de los registros PAI a datetime.
+    Las celdas pueden llegar como fechas de Excel, como texto mes/día/año
+    abreviado ("4/12/25" es el 12 de abril, formato %m/%d/%y) o como números de serie de Excel;
+    cada caso se resuelve con una sola conversión vectorizada en lugar de
+    interpretar cada valor por separado.
+    
+    Args:
+        serie: Serie con los valores de fecha.
+        
+    Returns:
+        Serie datetime64 con NaT donde el valor no es una fecha válida.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if pd.api.types.is_numeric_dtype(serie):
+        return _fechas_desde_serial(serie)
+    
+    # Fechas nativas y texto con el formato habitual (cache=True reutiliza los textos repetidos)
+    resultado = pd.to_datetime(serie, format="%m/%d/%y", errors="coerce", cache=True)
+    
+    pendientes = resultado.isna() & serie.notna()
+    if pendientes.any():
+        restantes = serie[pendientes]
+        
+        # Números de serie de Excel. Un texto numérico solo se toma como serial si no puede
+        # ser un año ("2025" es el 1 de enero de 2025, no el día 2025 desde 1899)
+        numeros = pd.to_numeric(restantes, errors="coerce")
+        es_texto = restantes.map(lambda valor: isinstance(valor, str))
+        es_numero = numeros.notna() & (~es_texto | (numeros > LIMITE_ANIO_TEXTO))
+        if es_numero.any():
+            resultado.loc[es_numero[es_numero].index] = _fechas_desde_serial(numeros[es_numero])
+        
+        # Cualquier otro texto: interpretación individual (formatos variados), una vez por texto distinto
+        otros = restantes[~es_numero]
+        if not otros.empty:
+            resultado.loc[otros.index] = pd.to_datetime(otros.astype(str), format="mixed", errors="coerce", cache=True)
+    
+    return resultado
+
 def clasificar_grupo_etario(edad_anios):
     """
     Clasifica la edad en un grupo etario.
@@ -392,6 +726,47 @@ def clasificar_grupo_etario(edad_anios):
     except Exception:
         return "No especificado"
 
+# Grupos etarios en el orden de clasificar_grupo_etario
+GRUPOS_ETARIOS = ["<1 año", "1-5 años", "6-10 años", "11-18 años", "19-60 años", ">60 años", "No especificado"]
+
+# Límite superior (incluido) de los grupos "1-5 años" a "19-60 años"
+LIMITES_GRUPOS_ETARIOS = np.array([5, 10, 18, 60], dtype=float)
+
+def clasificar_grupo_etario_series(edades: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de clasificar_grupo_etario para una columna numérica de edades.
+    
+    Args:
+        edades: Serie numérica con la edad en años (NaN si no se conoce).
+        
+    Returns:
+        Serie categórica con el grupo etario de cada fila.
+    """
+    valores = edades.to_numpy(dtype=float, na_value=np.nan)
+    
+    # El código de cada fila sale de una búsqueda binaria sobre los límites, sin crear
+    # textos intermedios. pd.cut no sirve tal cual: el primer grupo excluye su límite
+    # (< 1) y los demás lo incluyen (<= 5, <= 10, ...)
+    codigos = np.searchsorted(LIMITES_GRUPOS_ETARIOS, valores, side="left").astype(np.int8) + 1
+    codigos[valores < 1] = 0
+    codigos[np.isnan(valores)] = len(GRUPOS_ETARIOS) - 1
+    
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=GRUPOS_ETARIOS), index=edades.index)
+
+def limpiar_nombre_columna(texto: str) -> str:
+    """
+    Convierte un texto de encabezado en un identificador: los caracteres no
+    alfanuméricos (incluidos espacios) pasan a un único guion bajo.
+    
+    Args:
+        texto: Texto del encabezado.
+        
+    Returns:
+        Texto limpio, sin guiones bajos al inicio/final.
+    """
+    texto = PATRON_NO_ALFANUMERICO.sub('_', texto.strip())
+    return PATRON_GUIONES.sub('_', texto).strip('_')
+
 def normalizar_nombres_columnas(df: pd.DataFrame) -> pd.DataFrame:
     """
     Normaliza los nombres de columnas para tener un formato estándar.
@@ -404,17 +779,17 @@ def normalizar_nombres_columnas(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         DataFrame con nombres de columnas normalizados.
     """
-    nuevos_nombres = {}
+    nuevos_nombres = []
     
-    for col in df.columns:
+    for idx, col in enumerate(df.columns):
         # Para columnas jerárquicas (tuplas)
         if isinstance(col, tuple):
             # Manejar caso especial de las primeras dos columnas sin encabezado en nivel 1
             if len(col) >= 2 and col[0] == 'Unnamed: 0_level_0' and col[1] == 'Consecutivo':
-                nuevos_nombres[col] = 'Consecutivo'
+                nuevos_nombres.append('Consecutivo')
                 continue
             elif len(col) >= 2 and col[0] == 'Unnamed: 1_level_0' and 'Fecha de atención' in str(col[1]):
-                nuevos_nombres[col] = 'Fecha_Atencion'
+                nuevos_nombres.append('Fecha_Atencion')
                 continue
                 
             # Obtener partes significativas
@@ -423,17 +798,7 @@ def normalizar_nombres_columnas(df: pd.DataFrame) -> pd.DataFrame:
                 if pd.notna(parte) and str(parte).strip():
                     # Ignorar partes como 'Unnamed: X_level_Y'
                     if not str(parte).startswith('Unnamed:'):
-                        # Limpiar texto
-                        parte_str = str(parte).strip()
-                        # Reemplazar caracteres no alfanuméricos
-                        parte_str = re.sub(r'[^\w ]', '_', parte_str)
-                        # Convertir espacios a guiones bajos
-                        parte_str = re.sub(r'\s+', '_', parte_str)
-                        # Eliminar guiones bajos múltiples
-                        parte_str = re.sub(r'_+', '_', parte_str)
-                        # Eliminar guiones bajos al inicio/final
-                        parte_str = parte_str.strip('_')
-                        
+                        parte_str = limpiar_nombre_columna(str(parte))
                         if parte_str:
                             partes.append(parte_str)
             
@@ -443,44 +808,30 @@ def normalizar_nombres_columnas(df: pd.DataFrame) -> pd.DataFrame:
                 nuevo_nombre = '_'.join(partes)
             else:
                 # Si no hay partes válidas, usar un nombre genérico
-                idx = list(df.columns).index(col)
                 nuevo_nombre = f"Columna_{idx}"
-            
-            nuevos_nombres[col] = nuevo_nombre
         
         # Para columnas simples (no tuplas)
+        elif pd.notna(col):
+            nuevo_nombre = limpiar_nombre_columna(str(col))
+            if not nuevo_nombre:
+                nuevo_nombre = f"Columna_{idx}"
         else:
-            if pd.notna(col):
-                nuevo_nombre = str(col).strip()
-                # Limpiar texto
-                nuevo_nombre = re.sub(r'[^\w ]', '_', nuevo_nombre)
-                nuevo_nombre = re.sub(r'\s+', '_', nuevo_nombre)
-                nuevo_nombre = re.sub(r'_+', '_', nuevo_nombre)
-                nuevo_nombre = nuevo_nombre.strip('_')
-                
-                if not nuevo_nombre:
-                    idx = list(df.columns).index(col)
-                    nuevo_nombre = f"Columna_{idx}"
-                
-                nuevos_nombres[col] = nuevo_nombre
-            else:
-                idx = list(df.columns).index(col)
-                nuevos_nombres[col] = f"Columna_{idx}"
+            nuevo_nombre = f"Columna_{idx}"
+        
+        nuevos_nombres.append(nuevo_nombre)
     
     # Verificar y resolver nombres duplicados
     nombres_usados = set()
-    for col, nuevo_nombre in list(nuevos_nombres.items()):
+    for idx, nuevo_nombre in enumerate(nuevos_nombres):
         if nuevo_nombre in nombres_usados:
             # Si ya existe, añadir un sufijo numérico basado en la posición
-            idx = list(df.columns).index(col)
-            nuevos_nombres[col] = f"{nuevo_nombre}_{idx}"
-        nombres_usados.add(nuevos_nombres[col])
-    
-    # Aplicar renombrado
-    df_normalizado = df.rename(columns=nuevos_nombres)
+            nuevos_nombres[idx] = f"{nuevo_nombre}_{idx}"
+        nombres_usados.add(nuevos_nombres[idx])
     
-    # Verificar que todas las columnas se hayan normalizado
-    columnas_problemáticas = [col for col in df_normalizado.columns if isinstance(col, tuple)]
+    # Aplicar renombrado asignando la lista completa (rename con claves tupla
+    # no modifica las columnas MultiIndex); la copia superficial no duplica datos
+    df_normalizado = df.copy(deep=False)
+    df_normalizado.columns = nuevos_nombres
     
     return df_normalizado
 
@@ -496,40 +847,98 @@ def validar_normalizacion(df: pd.DataFrame) -> pd.DataFrame:
         DataFrame con todas las columnas correctamente normalizadas.
     """
     # Identificar columnas que siguen siendo tuplas
-    columnas_problematicas = [col for col in df.columns if isinstance(col, tuple)]
+    if not any(isinstance(col, tuple) for col in df.columns):
+        return df
+    
+    nuevos_nombres = []
+    for idx, col in enumerate(df.columns):
+        if not isinstance(col, tuple):
+            nuevos_nombres.append(col)
+            continue
+        
+        # Crear nombre basado en contenido y posición: unir partes no nulas
+        partes = []
+        for parte in col:
+            if pd.notna(parte) and str(parte).strip():
+                parte_str = limpiar_nombre_columna(str(parte))
+                if parte_str:
+                    partes.append(parte_str)
+        
+        if partes:
+            nuevo_nombre = f"{'_'.join(partes)}_{idx}"
+        else:
+            nuevo_nombre = f"Columna_{idx}"
+        
+        nuevos_nombres.append(nuevo_nombre)
+        print(f"  - Corrigiendo columna problemática: {col} -> {nuevo_nombre}")
+    
+    # Aplicar renombrado
+    df = df.copy(deep=False)
+    df.columns = nuevos_nombres
+    
+    return df
+
+# Bytes iniciales del archivo que entran en la clave de caché
+BYTES_HUELLA_CACHE = 65536
+
+def clave_cache_archivo(ruta_archivo: str, variante: Optional[str] = None) -> str:
+    """
+    Calcula la clave de caché de un archivo a partir de su tamaño, fecha de
+    modificación y el hash de sus primeros bytes.
+    
+    La versión del paquete forma parte de la clave: al cambiar el procesamiento,
+    las entradas anteriores dejan de usarse.
     
-    if columnas_problematicas:
-        # Crear diccionario para renombrar
-        nuevos_nombres = {}
+    Args:
+        ruta_archivo: Ruta al archivo.
+        variante: Opción de procesamiento que cambia el resultado (p. ej. el motor de lectura).
         
-        for col in columnas_problematicas:
-            # Crear nombre basado en contenido y posición
-            idx = list(df.columns).index(col)
-            
-            # Unir partes no nulas
-            partes = []
-            for parte in col:
-                if pd.notna(parte) and str(parte).strip():
-                    parte_str = str(parte).strip()
-                    # Convertir caracteres no alfanuméricos a guiones bajos
-                    parte_str = re.sub(r'[^\w]', '_', parte_str)
-                    # Eliminar guiones bajos múltiples
-                    parte_str = re.sub(r'_+', '_', parte_str)
-                    # Eliminar guiones bajos al inicio/final
-                    parte_str = parte_str.strip('_')
-                    
-                    if parte_str:
-                        partes.append(parte_str)
-            
-            if partes:
-                nuevo_nombre = f"{'_'.join(partes)}_{idx}"
-            else:
-                nuevo_nombre = f"Columna_{idx}"
-            
-            nuevos_nombres[col] = nuevo_nombre
-            print(f"  - Corrigiendo columna problemática: {col} -> {nuevo_nombre}")
+    Returns:
+        Clave hexadecimal del archivo.
+    """
+    info = os.stat(ruta_archivo)
+    with open(ruta_archivo, "rb") as f:
+        inicio = hashlib.sha1(f.read(BYTES_HUELLA_CACHE)).hexdigest()
+    
+    huella = f"{os.path.abspath(ruta_archivo)}:{info.st_size}:{info.st_mtime_ns}:{inicio}:{__version__}:{variante or ''}"
+    return hashlib.blake2b(huella.encode("utf-8"), digest_size=20).hexdigest()
+
+def leer_cache_archivo(directorio_cache: str, clave: str) -> Optional[Tuple[pd.DataFrame, List[str]]]:
+    """
+    Recupera el resultado guardado para una clave de caché.
+    
+    Args:
+        directorio_cache: Directorio de la caché.
+        clave: Clave calculada con clave_cache_archivo.
         
-        # Aplicar renombrado
-        df = df.rename(columns=nuevos_nombres)
+    Returns:
+        Tuple con (DataFrame, advertencias) o None si no hay una entrada válida.
+    """
+    ruta = os.path.join(directorio_cache, f"{clave}.pkl")
+    try:
+        with open(ruta, "rb") as f:
+            entrada = pickle.load(f)
+        return entrada["datos"], entrada["advertencias"]
+    except Exception:
+        # Sin entrada o entrada dañada: se procesa el archivo de nuevo
+        return None
+
+def guardar_cache_archivo(directorio_cache: str, clave: str, df: pd.DataFrame, advertencias: List[str]):
+    """
+    Guarda el resultado de procesar un archivo en la caché.
     
-    return df
\ No newline at end of file
+    Se escribe en un archivo temporal y luego se renombra, para que una ejecución
+    interrumpida (o dos procesos a la vez) no dejen entradas a medio escribir.
+    
+    Args:
+        directorio_cache: Directorio de la caché.
+        clave: Clave calculada con clave_cache_archivo.
+        df: DataFrame procesado.
+        advertencias: Advertencias generadas al procesar el archivo.
+    """
+    os.makedirs(directorio_cache, exist_ok=True)
+    ruta = os.path.join(directorio_cache, f"{clave}.pkl")
+    ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(ruta_temporal, "wb") as f:
+        pickle.dump({"datos": df, "advertencias": list(advertencias)}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(ruta_temporal, ruta)
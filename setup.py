@@ -7,8 +7,13 @@ setup(
     install_requires=[
         "pandas",
         "openpyxl",
+        "xlsxwriter",
         "numpy",
     ],
+    extras_require={
+        # Lectura de Excel mucho más rápida (se usa automáticamente si está instalado)
+        "calamine": ["python-calamine"],
+    },
     entry_points={
         "console_scripts": [
             "pai-consolidator=pai_consolidator.cli:main",
@@ -0,0 +1,95 @@
+"""
+Tests para la interfaz de línea de comandos.
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import patch
+from pai_consolidator.cli import main, _tabla_arrow
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+@pytest.fixture
+def consolidado():
+    """DataFrame consolidado con los tipos de columna que produce el procesador."""
+    return pd.DataFrame({
+        "Municipio_Vacunacion": pd.Categorical(["IBAGUE", "CASABIANCA", "IBAGUE"]),
+        "Nombre": pd.Series(["ANA", None, "LUIS"], dtype="string[pyarrow]"),
+        "Fiebre_amarilla_Dosis": pd.Series([pd.Timestamp("2025-04-12"), "Única", None], dtype=object),
+        "Edad_Num": [3.0, np.nan, 70.0],
+        "Consecutivo": [1, 2, 3],
+        "Fecha": pd.to_datetime(["2025-04-12", None, "2025-04-13"])
+    })
+
+def test_tabla_arrow_ida_y_vuelta(tmp_path, consolidado):
+    """Prueba que la copia Parquet conserve los valores y tipos del consolidado."""
+    ruta = str(tmp_path / "consolidado.parquet")
+    pq.write_table(_tabla_arrow(consolidado), ruta)
+    
+    leido = pd.read_parquet(ruta)
+    
+    assert list(leido.columns) == list(consolidado.columns)
+    assert isinstance(leido["Municipio_Vacunacion"].dtype, pd.CategoricalDtype)
+    assert leido["Municipio_Vacunacion"].tolist() == ["IBAGUE", "CASABIANCA", "IBAGUE"]
+    assert leido["Nombre"].tolist() == ["ANA", None, "LUIS"]
+    # La columna mixta se guarda como texto
+    assert leido["Fiebre_amarilla_Dosis"].tolist() == ["2025-04-12 00:00:00", "Única", None]
+    pd.testing.assert_series_equal(leido["Edad_Num"], consolidado["Edad_Num"])
+    pd.testing.assert_series_equal(leido["Consecutivo"], consolidado["Consecutivo"])
+    pd.testing.assert_series_equal(leido["Fecha"], consolidado["Fecha"])
+
+def _cargar_en_modo_filtrar(monkeypatch, tmp_path, archivo_consolidado):
+    """
+    Ejecuta main en modo 'filtrar' y devuelve los datos que recibió filtrar_por_vacuna.
+    
+    Args:
+        monkeypatch: Fixture de pytest para cambiar sys.argv.
+        tmp_path: Directorio temporal para la salida.
+        archivo_consolidado: Ruta del consolidado a cargar.
+    
+    Returns:
+        DataFrame cargado como datos consolidados.
+    """
+    monkeypatch.setattr(sys, "argv", [
+        "pai_consolidator", "-d", str(tmp_path), "-M", "filtrar",
+        "-ac", archivo_consolidado, "-o", str(tmp_path / "salida")
+    ])
+    
+    # Sin resultados el programa termina con sys.exit(1) justo después de cargar los datos
+    with patch("pai_consolidator.core.processor.PaiProcessor.filtrar_por_vacuna",
+               autospec=True, return_value={}) as mock_filtrar, \
+         pd.option_context("mode.copy_on_write", False), \
+         pytest.raises(SystemExit):
+        main()
+    
+    return mock_filtrar.call_args[0][0].datos_consolidados
+
+def test_filtrar_usa_copia_parquet(monkeypatch, tmp_path, consolidado):
+    """Prueba que el modo 'filtrar' prefiera la copia Parquet junto al consolidado."""
+    ruta_excel = str(tmp_path / "Consolidado_General.xlsx")
+    consolidado.iloc[:1].to_excel(ruta_excel, index=False)
+    pq.write_table(_tabla_arrow(consolidado), str(tmp_path / "Consolidado_General.parquet"))
+    
+    datos = _cargar_en_modo_filtrar(monkeypatch, tmp_path, ruta_excel)
+    
+    assert len(datos) == 3
+    assert isinstance(datos["Municipio_Vacunacion"].dtype, pd.CategoricalDtype)
+    assert datos["Nombre"].tolist() == ["ANA", None, "LUIS"]
+
+def test_filtrar_ignora_copia_parquet_anterior(monkeypatch, tmp_path, consolidado):
+    """Prueba que una copia Parquet anterior al archivo indicado no se use."""
+    ruta_excel = str(tmp_path / "Consolidado_General.xlsx")
+    ruta_parquet = str(tmp_path / "Consolidado_General.parquet")
+    consolidado.iloc[:1].to_excel(ruta_excel, index=False)
+    pq.write_table(_tabla_arrow(consolidado), ruta_parquet)
+    
+    # El consolidado se regeneró después de la copia
+    modificado = os.path.getmtime(ruta_excel)
+    os.utime(ruta_parquet, (modificado - 60, modificado - 60))
+    
+    datos = _cargar_en_modo_filtrar(monkeypatch, tmp_path, ruta_excel)
+    
+    assert len(datos) == 1
+    assert datos["Nombre"].tolist() == ["ANA"]
@@ -106,4 +106,70 @@ def test_consolidar_archivos():
         assert "vacunacion" in resultado
         assert "residencia" in resultado
         assert len(resultado["vacunacion"]) == 4
-        assert len(resultado["residencia"]) == 4
\ No newline at end of file
+        assert len(resultado["residencia"]) == 4
+
+def test_generar_estadisticas():
+    """Prueba los conteos de la generación de estadísticas."""
+    df = pd.DataFrame({
+        "Año_Registro": ["2025", "2024", "2025", None],
+        "Mes_Registro": ["05", "04", "04", "04"],
+        "Municipio_Vacunacion": ["IBAGUE", "IBAGUE", "ESPINAL", None],
+        "Grupo_Etario": ["1-5 años", "1-5 años", ">60 años", "No especificado"],
+    })
+    
+    estadisticas = PaiProcessor().generar_estadisticas(df, "vacunacion")
+    
+    assert estadisticas["total_registros"] == 4
+    assert list(estadisticas["registros_por_año"].items()) == [("2024", 1), ("2025", 2)]
+    assert list(estadisticas["registros_por_mes"].items()) == [("04", 3), ("05", 1)]
+    assert estadisticas["municipios_vacunacion"] == {"IBAGUE": 2, "ESPINAL": 1}
+    assert estadisticas["total_municipios"] == 2
+    assert estadisticas["distribucion_grupo_etario"]["1-5 años"] == 2
+
+def test_procesar_archivo_con_cache(tmp_path):
+    """Prueba que un archivo sin cambios se recupera de la caché sin volver a procesarse."""
+    archivo = tmp_path / "PAI_ABRIL.xlsx"
+    archivo.write_bytes(b"contenido")
+    df_procesado = pd.DataFrame({"Municipio_Vacunacion": ["IBAGUE", "IBAGUE"]})
+    
+    with patch("pai_consolidator.core.processor._procesar_archivo_pai",
+               return_value=df_procesado) as mock_procesar:
+        processor = PaiProcessor(directorio_cache=str(tmp_path / "cache"))
+        primero = processor.procesar_archivo(str(archivo))
+        segundo = processor.procesar_archivo(str(archivo))
+        
+        assert mock_procesar.call_count == 1
+        pd.testing.assert_frame_equal(primero, segundo)
+        
+        # Al modificar el archivo la entrada deja de ser válida
+        archivo.write_bytes(b"contenido modificado")
+        processor.procesar_archivo(str(archivo))
+        assert mock_procesar.call_count == 2
+
+def test_filtrar_por_vacuna_dosis():
+    """Prueba las columnas de dosis que añade el filtro por vacuna."""
+    processor = PaiProcessor()
+    processor.datos_consolidados = pd.DataFrame({
+        "Municipio_Vacunacion": ["IBAGUE"] * 9,
+        "Año_Registro": ["2025"] * 9,
+        "Mes_Registro": ["04"] * 9,
+        "Fiebre_amarilla_Dosis": [None, "fin", "ÚNICA", " unica ", "1ra dosis/PRIMERA",
+                                  "Segunda", "Refuerzo", 5, None],
+        "Fiebre_amarilla_Lote": ["L0", "L1", "L2", None, "L4", "L5", "L6", "L7", None]
+    })
+    
+    resultado = processor.filtrar_por_vacuna("Fiebre amarilla", "ambos")
+    
+    assert set(resultado) == {"vacunacion", "residencia"}
+    df = resultado["vacunacion"]
+    
+    # La última fila no tiene datos de la vacuna
+    assert len(df) == 8
+    assert df["Vacunado"].tolist() == [False, False, True, True, True, True, True, True]
+    assert df["Tipo_Dosis"].tolist()[2:] == ["ÚNICA", "UNICA", "1RA DOSIS/PRIMERA", "SEGUNDA", "REFUERZO", "5"]
+    assert df["Tipo_Dosis"][:2].isna().all()
+    assert df["Es_Primera_Dosis"].tolist() == [0, 0, 0, 0, 1, 0, 0, 0]
+    assert df["Es_Segunda_Dosis"].tolist() == [0, 0, 0, 0, 0, 1, 0, 0]
+    assert df["Es_Refuerzo"].tolist() == [0, 0, 0, 0, 0, 0, 1, 0]
+    assert df["Es_Unica_Dosis"].tolist() == [0, 0, 1, 1, 0, 0, 0, 0]
+    assert list(df.columns[:3]) == ["Municipio_Vacunacion", "Año_Registro", "Mes_Registro"]
@@ -2,26 +2,32 @@
 Tests para las funciones de utilidad.
 """
 import os
+import numpy as np
 import pandas as pd
 import pytest
 from pai_consolidator.core.utils import (
-    extraer_nombre_municipio,
-    encontrar_columnas_vacuna,
-    identificar_columna_dosis,
     clasificar_grupo_etario,
     limpiar_texto,
-    extraer_info_ruta,
-    extraer_vereda_de_direccion
+    limpiar_texto_series,
+    convertir_fechas,
+    leer_hoja_cruda,
+    construir_desde_cuadricula,
+    clasificar_grupo_etario_series,
+    PYARROW_DISPONIBLE
 )
 
 def test_extraer_nombre_municipio():
     """Prueba la extracción del nombre del municipio."""
+    from pai_consolidator.core.utils import extraer_nombre_municipio
+    
     assert extraer_nombre_municipio("CASABIANCA_REGISTRO.xlsm") == "CASABIANCA"
     assert extraer_nombre_municipio("REGISTRO_IBAGUE_ABRIL.xlsm") == "IBAGUE"
     assert extraer_nombre_municipio("archivo_sin_patron.xlsm") == "ARCHIVO_SIN_PATRON"
 
 def test_extraer_info_ruta():
     """Prueba la extracción de información de la ruta."""
+    from pai_consolidator.core.utils import extraer_info_ruta
+    
     # Ruta con estructura completa
     ruta = os.path.join("REGISTROS_2025", "IBAGUE", "PAI_ABRIL.xlsm")
     info = extraer_info_ruta(ruta)
@@ -38,6 +44,8 @@ def test_extraer_info_ruta():
 
 def test_encontrar_columnas_vacuna():
     """Prueba la búsqueda de columnas de vacuna."""
+    from pai_consolidator.core.utils import encontrar_columnas_vacuna
+    
     df = pd.DataFrame({
         "A": [1, 2, 3],
         "Fiebre amarilla": [4, 5, 6],
@@ -52,6 +60,8 @@ def test_encontrar_columnas_vacuna():
 
 def test_identificar_columna_dosis():
     """Prueba la identificación de la columna de dosis."""
+    from pai_consolidator.core.utils import identificar_columna_dosis
+    
     df = pd.DataFrame({
         "Vacuna": ["Nombre", "Valor", "Otro"],
         "Dosis": ["Dosis", "Primera dosis", "Segunda dosis"],
@@ -70,6 +80,25 @@ def test_clasificar_grupo_etario():
     assert clasificar_grupo_etario(30) == "19-60 años"
     assert clasificar_grupo_etario(70) == ">60 años"
 
+def test_clasificar_grupo_etario_series():
+    """Prueba la clasificación vectorizada en cada límite, contra la versión por valor."""
+    edades = pd.Series([
+        -3, -0.5, 0, 0.99, 1, 4.9, 5, 5.01, 6, 10, 10.5, 11, 18, 18.2, 19,
+        60, 60.01, 61, 120, np.nan, np.inf, -np.inf
+    ])
+    esperado = [
+        "<1 año", "<1 año", "<1 año", "<1 año", "1-5 años", "1-5 años", "1-5 años",
+        "6-10 años", "6-10 años", "6-10 años", "11-18 años", "11-18 años", "11-18 años",
+        "19-60 años", "19-60 años", "19-60 años", ">60 años", ">60 años", ">60 años",
+        "No especificado", ">60 años", "<1 año"
+    ]
+    
+    resultado = clasificar_grupo_etario_series(edades)
+    
+    assert list(resultado) == esperado
+    assert list(resultado) == [clasificar_grupo_etario(edad) for edad in edades]
+    assert resultado.index.equals(edades.index)
+
 def test_limpiar_texto():
     """Prueba la limpieza de texto."""
     assert limpiar_texto("  texto con  espacios  ") == "TEXTO CON ESPACIOS"
@@ -78,8 +107,113 @@ def test_limpiar_texto():
 
 def test_extraer_vereda_de_direccion():
     """Prueba la extracción de vereda de una dirección."""
+    from pai_consolidator.core.utils import extraer_vereda_de_direccion
+    
     assert extraer_vereda_de_direccion("VEREDA LA PALMA, CASA 5") == "LA PALMA"
     assert extraer_vereda_de_direccion("VDA EL CARMEN - FINCA LOS NARANJOS") == "EL CARMEN"
     assert extraer_vereda_de_direccion("CARRERA 5 #10-15") is None
     assert extraer_vereda_de_direccion("CORREGIMIENTO SAN BERNARDO") == "SAN BERNARDO"
-    assert extraer_vereda_de_direccion(123) is None
\ No newline at end of file
+    assert extraer_vereda_de_direccion(123) is None
+
+def test_limpiar_texto_series():
+    """Prueba la limpieza vectorizada de texto contra la versión por valor."""
+    serie = pd.Series(
+        ["  ibagué ", "IBAGUÉ", "San\n  Sebastián", "Ñame  dulce", "", 123, 4.5, None, np.nan, "ibagué"],
+        index=range(10, 20),
+        dtype=object
+    )
+    
+    resultado = limpiar_texto_series(serie)
+    
+    assert resultado.dtype == object
+    assert resultado.index.equals(serie.index)
+    assert resultado.tolist() == [
+        "IBAGUÉ", "IBAGUÉ", "SAN SEBASTIÁN", "ÑAME DULCE", "", "123", "4.5", None, None, "IBAGUÉ"
+    ]
+    no_nulos = serie.notna()
+    assert resultado[no_nulos].tolist() == [limpiar_texto(valor) for valor in serie[no_nulos]]
+
+def test_limpiar_texto_series_otros_tipos():
+    """Prueba la limpieza de columnas sin texto y de texto en pyarrow."""
+    assert limpiar_texto_series(pd.Series([1, 2, 1])).tolist() == ["1", "2", "1"]
+    assert limpiar_texto_series(pd.Series([1.5, np.nan])).tolist() == ["1.5", None]
+    assert limpiar_texto_series(pd.Series([None, np.nan], dtype=object)).tolist() == [None, None]
+    
+    if PYARROW_DISPONIBLE:
+        serie = pd.Series([" a  b ", None, "Árbol"], dtype="string[pyarrow]")
+        assert limpiar_texto_series(serie).tolist() == ["A B", None, "ÁRBOL"]
+
+def test_convertir_fechas():
+    """Prueba la conversión de fechas en sus distintos formatos de origen."""
+    serie = pd.Series([
+        "4/12/25",              # mes/día/año abreviado
+        "2025-03-15",           # ISO
+        "15/04/2025",           # día primero
+        "2025",                 # año suelto
+        45000,                  # serial de Excel
+        45000.5,                # serial con hora
+        "45000",                # serial escrito como texto
+        pd.Timestamp("2025-01-02"),
+        None,
+        "sin fecha"
+    ], dtype=object)
+    
+    resultado = convertir_fechas(serie)
+    
+    assert pd.api.types.is_datetime64_any_dtype(resultado)
+    assert resultado[0] == pd.Timestamp("2025-04-12")
+    assert resultado[1] == pd.Timestamp("2025-03-15")
+    assert resultado[2] == pd.Timestamp("2025-04-15")
+    assert resultado[3] == pd.Timestamp("2025-01-01")
+    assert resultado[4] == pd.Timestamp("2023-03-15")
+    assert resultado[5] == pd.Timestamp("2023-03-15 12:00")
+    assert resultado[6] == pd.Timestamp("2023-03-15")
+    assert resultado[7] == pd.Timestamp("2025-01-02")
+    assert pd.isna(resultado[8])
+    assert pd.isna(resultado[9])
+
+def test_convertir_fechas_columna_numerica():
+    """Prueba que una columna numérica se interprete como seriales de Excel."""
+    resultado = convertir_fechas(pd.Series([45000, 45292]))
+    assert list(resultado) == [pd.Timestamp("2023-03-15"), pd.Timestamp("2024-01-01")]
+
+def _guardar_libro(ruta, filas, combinadas=()):
+    """Guarda un libro de una hoja con las filas y celdas combinadas indicadas."""
+    openpyxl = pytest.importorskip("openpyxl")
+    libro = openpyxl.Workbook()
+    hoja = libro.active
+    for fila in filas:
+        hoja.append(fila)
+    for rango in combinadas:
+        hoja.merge_cells(rango)
+    libro.save(ruta)
+    return str(ruta)
+
+def test_construir_desde_cuadricula_encabezado_plano(tmp_path):
+    """Prueba que la cuadrícula con encabezado plano dé lo mismo que pd.read_excel."""
+    ruta = _guardar_libro(tmp_path / "plano.xlsx", [
+        ["Nombre", "Edad", "Fecha", "Dosis"],
+        ["ANA", 3, "4/12/25", "Única"],
+        ["LUIS", None, None, None],
+        ["EVA", 2.5, "4/13/25", "Primera"],
+    ])
+    
+    crudo = leer_hoja_cruda(ruta, 0, "openpyxl")
+    for header in (0, [0]):
+        esperado = pd.read_excel(ruta, header=header, engine="openpyxl")
+        pd.testing.assert_frame_equal(construir_desde_cuadricula(crudo, header), esperado)
+
+def test_construir_desde_cuadricula_encabezado_combinado(tmp_path):
+    """Prueba que la cuadrícula con encabezado de varias filas combinadas dé lo mismo que pd.read_excel."""
+    ruta = _guardar_libro(tmp_path / "combinado.xlsx", [
+        ["Datos", None, "Fiebre amarilla", None, None, "Otra"],
+        ["Paciente", None, "Aplicación", None, "Lote", None],
+        ["Nombre", "Edad", "Dosis", None, "Número", "Valor"],
+        ["ANA", 3, "Única", "x", "L1", 1],
+        ["LUIS", None, None, None, "L2", 2],
+    ], combinadas=("A1:B1", "C1:E1", "A2:B2", "C2:D2"))
+    
+    crudo = leer_hoja_cruda(ruta, 0, "openpyxl")
+    for header in ([0, 1], [0, 1, 2], [1, 2]):
+        esperado = pd.read_excel(ruta, header=header, engine="openpyxl")
+        pd.testing.assert_frame_equal(construir_desde_cuadricula(crudo, header), esperado)